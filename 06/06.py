@@ -1,10 +1,75 @@
 #! /usr/bin/env python
 
 from __future__ import print_function
-from collections import OrderedDict
+from array import array
 import argparse
 
 
+def orbit_depths(parents, root):
+    """count the orbits of every body, given an array of parent ids.
+
+    Each body's chain towards the root is only walked as far as the first
+    body whose depth is already known, then filled in on the way back, so
+    every body is visited a constant number of times and no recursion is
+    needed.
+    """
+    n = len(parents)
+    depths = array("i", [-1]) * n
+    depths[root] = 0
+    for body in range(n):
+        path = []
+        current = body
+        while depths[current] < 0:
+            path.append(current)
+            current = parents[current]
+            if current < 0 or len(path) > n:
+                raise Exception("body {} does not orbit the root".format(body))
+        depth = depths[current]
+        for b in reversed(path):
+            depth += 1
+            depths[b] = depth
+    return depths
+
+
+def build_lifting_table(parents, depths):
+    """build a binary lifting table for lowest common ancestor queries.
+
+    table[k][i] is the body 2**k steps towards the root from body i (the
+    root is its own parent here).
+    """
+    first = array("i", parents)
+    for i, parent in enumerate(first):
+        if parent < 0:
+            first[i] = i
+    table = [first]
+    for _ in range(max(depths).bit_length() - 1):
+        previous = table[-1]
+        table.append(array("i", [previous[previous[i]] for i in range(len(previous))]))
+    return table
+
+
+def lowest_common_ancestor(table, depths, a, b):
+    """find the deepest body that both a and b orbit (or are), in O(log n)."""
+    if depths[a] < depths[b]:
+        a, b = b, a
+    # lift a to the same depth as b
+    diff = depths[a] - depths[b]
+    k = 0
+    while diff:
+        if diff & 1:
+            a = table[k][a]
+        diff >>= 1
+        k += 1
+    if a == b:
+        return a
+    # lift both to just below their common ancestor
+    for k in reversed(range(len(table))):
+        if table[k][a] != table[k][b]:
+            a = table[k][a]
+            b = table[k][b]
+    return table[0][a]
+
+
 class Body(object):
     """class representing an orbital body.
 
@@ -28,51 +93,80 @@ class OrbitalMap(object):
             name = s[1]
             parent_name = s[0]
             self.bodies[name] = Body(name, parent_name)
-
-    def _calculate_orbits(self, body_name, root_name="COM"):
-        """count number of orbits of a body back to a root body"""
-        body = self.bodies[body_name]
-        if body.name == root_name:
-            return 0
-        else:
-            return 1 + self._calculate_orbits(body.parent)
+        self.depths = None
+        self.lifting = None
+
+    def _build_index(self):
+        """number the bodies and compute their depths (orbit counts)."""
+        self.names = list(self.bodies)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.parents = array("i", [-1]) * len(self.names)
+        for name, body in self.bodies.items():
+            if body.parent is not None:
+                self.parents[self.ids[name]] = self.ids[body.parent]
+        self.depths = orbit_depths(self.parents, self.ids["COM"])
 
     def calculate_all_orbits(self):
         """calculate the number of direct and indirect orbits in the map."""
+        if self.depths is None:
+            self._build_index()
+        return sum(self.depths)
 
-        orbits = 0
-        for b in self.bodies:
-            orbits += self._calculate_orbits(b)
-        return orbits
-
-    def _build_orbit_chain(self, body_name):
-        """build a chain of bodies, from body_name back to COM.
+    def _build_lca_index(self):
+        if self.depths is None:
+            self._build_index()
+        self.lifting = build_lifting_table(self.parents, self.depths)
 
-        the chain is indexed by the body name, with the value being the number
-        of transfers required to get there."""
+    def calculate_transfers(self, from_name, to_name):
+        """count transfers from the body from_name orbits to the one to_name orbits.
 
-        chain = OrderedDict()
-        transfers = 0
-        current = self.bodies[body_name]
-        while current.parent != "COM":
-            chain[current.parent] = transfers
-            current = self.bodies[current.parent]
-            transfers += 1
-        chain["COM"] = transfers
-        return chain
+        The transfers go down to the innermost body both of those bodies
+        orbit (their lowest common ancestor) and back out again.
+        """
+        if self.lifting is None:
+            self._build_lca_index()
+        a = self.parents[self.ids[from_name]]
+        b = self.parents[self.ids[to_name]]
+        if a < 0 or b < 0:
+            raise Exception("COM does not orbit anything")
+        common = lowest_common_ancestor(self.lifting, self.depths, a, b)
+        return self.depths[a] + self.depths[b] - 2 * self.depths[common]
+
+    def calculate_transfers_batch(self, pairs):
+        """calculate_transfers for a list of (from_name, to_name) pairs."""
+        return [self.calculate_transfers(a, b) for a, b in pairs]
 
     def calculate_transfers_to_santa(self):
-        """count number of transfers needed to orbit the same body as santa.
+        """count number of transfers needed to orbit the same body as santa."""
+        return self.calculate_transfers("YOU", "SAN")
+
+class CompactOrbitalMap(OrbitalMap):
+    """OrbitalMap without an object per body.
+
+    Body names are interned to integer ids as the map is read (textmap can
+    be any iterable of lines, such as an open file), and each body's parent
+    id is kept in a single array. Supports the same orbit and transfer
+    queries as OrbitalMap.
+    """
+
+    def __init__(self, textmap):
+        self.ids = {"COM": 0}
+        self.parents = array("i", [-1])
+        for line in textmap:
+            parent_name, _, name = line.strip().partition(")")
+            self.parents[self._intern(name)] = self._intern(parent_name)
+        self.depths = None
+        self.lifting = None
+
+    def _intern(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.parents)
+            self.parents.append(-1)
+        return self.ids[name]
+
+    def _build_index(self):
+        self.depths = orbit_depths(self.parents, self.ids["COM"])
 
-        The transfers needed to get from YOU to SAN is the sum of the transfers
-        to get from each to the outermost common body.
-        """
-        you = self._build_orbit_chain("YOU")
-        san = self._build_orbit_chain("SAN")
-        # search for first (outermost) body in common
-        for b in you:
-            if b in san:
-                return you[b] + san[b]
 
 def test():
     # test1: orbit parsing and counting
@@ -88,8 +182,9 @@ def test():
             "J)K\n",
             "K)L\n"
             ]
-    if OrbitalMap(input1).calculate_all_orbits() != 42:
-        raise Exception("test1 failed")
+    for map_class in [OrbitalMap, CompactOrbitalMap]:
+        if map_class(input1).calculate_all_orbits() != 42:
+            raise Exception("test1 failed")
 
     # test2: transfer orbits to santa
     input2 = ["COM)B",
@@ -106,16 +201,28 @@ def test():
             "K)YOU",
             "I)SAN"
             ]
-    if OrbitalMap(input2).calculate_transfers_to_santa() != 4:
+    for map_class in [OrbitalMap, CompactOrbitalMap]:
+        if map_class(input2).calculate_transfers_to_santa() != 4:
             raise Exception("test2 failed")
 
+    # test3: transfers between arbitrary bodies
+    for map_class in [OrbitalMap, CompactOrbitalMap]:
+        if map_class(input2).calculate_transfers_batch(
+                [("L", "H"), ("SAN", "YOU"), ("F", "J"), ("H", "G")]) != [6, 4, 0, 1]:
+            raise Exception("test3 failed")
+
 
 if __name__ == "__main__":
     test()
     parser = argparse.ArgumentParser()
     parser.add_argument("input", help="input orbital map file")
+    parser.add_argument("--compact", action="store_true",
+            help="read the map into the array-backed CompactOrbitalMap")
     args = parser.parse_args()
     with open(args.input, "r") as infile:
-        o = OrbitalMap(infile.readlines())
+        if args.compact:
+            o = CompactOrbitalMap(infile)
+        else:
+            o = OrbitalMap(infile.readlines())
         print("orbits in input file: {}".format(o.calculate_all_orbits()))
         print("transfers to get to santa: {}".format(o.calculate_transfers_to_santa()))
@@ -1,33 +1,198 @@
 #! /usr/bin/env python
 from __future__ import print_function, division
-from math import atan2, pi, sqrt
-from collections import defaultdict
+from math import pi
+from multiprocessing import Pool, cpu_count
+try:
+    from math import gcd
+except ImportError:
+    from fractions import gcd
+
+import numpy as np
+
+def reduce_direction(dx, dy):
+    """reduce an offset to the smallest integer step in the same direction.
+
+    Asteroids along the same line of sight from a station reduce to exactly
+    the same (dx, dy), so there is no floating point comparison involved.
+    """
+    g = gcd(abs(dx), abs(dy))
+    return dx // g, dy // g
+
+def count_visible_block(coords, start, stop, w, h):
+    """count the asteroids visible from stations coords[start:stop].
+
+    The offsets to every asteroid are divided by their gcd to get exact
+    integer directions, which are packed into one integer key each. The
+    number of visible asteroids is the number of distinct keys in the
+    station's row. w and h are the width and height spanned by coords.
+    """
+    xs = coords[:, 0]
+    ys = coords[:, 1]
+    dx = xs[np.newaxis, :] - xs[start:stop, np.newaxis]
+    dy = ys[np.newaxis, :] - ys[start:stop, np.newaxis]
+    g = np.gcd(dx, dy)
+    is_self = g == 0
+    g[is_self] = 1
+    # reduced offsets lie in [-w, w] x [-h, h]
+    keys = (dx // g + w) * (2 * h + 1) + (dy // g + h)
+    # every station has exactly one self entry; give it a key of its own so
+    # it counts as one extra distinct value
+    keys[is_self] = -1
+    keys.sort(axis=1)
+    return np.count_nonzero(np.diff(keys, axis=1), axis=1)
+
+def station_block_stats(coords, start, stop):
+    """evaluate stations coords[start:stop] against every asteroid.
+
+    returns the visible count for each station, and lower bounds on how many
+    asteroids each asteroid cannot see, from the lines through the stations
+    that hold at least three asteroids. A station sees along a line in both
+    directions, so it knows every asteroid on it, and each of those
+    asteroids can see exactly two of the others (one either way), or one if
+    it is at an end. A line is only counted from the station with the lowest
+    index on it, so no line is counted twice however the stations are split
+    into blocks. The bounds are returned as two arrays: asteroid indices and
+    how many asteroids each cannot see along the counted lines.
+    """
+    n = len(coords)
+    xs = coords[:, 0]
+    ys = coords[:, 1]
+    w = int(xs.max() - xs.min())
+    h = int(ys.max() - ys.min())
+    rows = stop - start
+    dx = xs[np.newaxis, :] - xs[start:stop, np.newaxis]
+    dy = ys[np.newaxis, :] - ys[start:stop, np.newaxis]
+    g = np.gcd(dx, dy)
+    is_self = g == 0
+    g[is_self] = 1
+    step_x = dx // g
+    step_y = dy // g
+    # key each ray by its line's direction (up to sign) and which way along
+    # the line it points, so that opposite rays sort next to each other
+    backward = (step_x < 0) | ((step_x == 0) & (step_y < 0))
+    keys = 2 * (np.abs(step_x) * (2 * h + 1) + np.where(backward, -step_y, step_y) + h)
+    keys += backward
+    keys[is_self] = -2
+    # make keys unique per station so one sort handles the whole block
+    offsets = np.arange(rows) * (2 * (w + 1) * (2 * h + 1) + 2) + 2
+    keys += offsets[:, np.newaxis]
+    order = np.argsort(keys, axis=None)
+    sorted_keys = keys.ravel()[order]
+    run_start = np.ones(len(sorted_keys), dtype=bool)
+    run_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    start_positions = np.flatnonzero(run_start)
+    # each station has one self run, which is not a direction
+    counts = np.bincount(order[start_positions] // n, minlength=rows) - 1
+
+    # count the asteroids on each line: the station and both of its rays
+    run_keys = sorted_keys[start_positions]
+    run_lengths = np.diff(np.append(start_positions, len(sorted_keys)))
+    run_line_size = run_lengths + 1
+    pair = (run_keys[1:] == run_keys[:-1] + 1) & (run_keys[:-1] % 2 == 0)
+    run_line_size[:-1][pair] += run_lengths[1:][pair]
+    run_line_size[1:][pair] += run_lengths[:-1][pair]
+
+    run_id = np.cumsum(run_start) - 1
+    sorted_g = g.ravel()[order]
+    farthest = sorted_g == np.maximum.reduceat(sorted_g, start_positions)[run_id]
+    line_size = run_line_size[run_id]
+    # (the self run is a line of one)
+    on_line = line_size >= 3
+    lines = sorted_keys[on_line] // 2
+    asteroid = order[on_line] % n
+    blocked = (line_size - 3 + farthest)[on_line]
+    if len(lines) == 0:
+        return counts, asteroid, blocked
+
+    # drop lines holding an asteroid with a lower index than the station
+    station = start + order[on_line] // n
+    new_line = np.ones(len(lines), dtype=bool)
+    new_line[1:] = lines[1:] != lines[:-1]
+    line_starts = np.flatnonzero(new_line)
+    lowest = np.minimum.reduceat(asteroid, line_starts)
+    keep = (lowest > station[line_starts])[np.cumsum(new_line) - 1]
+    totals = np.bincount(asteroid[keep], weights=blocked[keep], minlength=n)
+    index = np.flatnonzero(totals)
+    return counts, index, totals[index].astype(np.int64)
+
+_worker_state = {}
+
+def _init_station_worker(shm_name, n):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=shm_name)
+    coords = np.ndarray((n, 2), dtype=np.int64, buffer=shm.buf)
+    _worker_state["shm"] = shm
+    _worker_state["coords"] = coords
+    _worker_state["size"] = (int(coords[:, 0].max() - coords[:, 0].min()),
+                             int(coords[:, 1].max() - coords[:, 1].min()))
+
+def _station_task(indices, with_bounds):
+    """evaluate a contiguous run of candidate stations in a worker.
+
+    returns the indices, their visible counts, and the blocker bounds from
+    station_block_stats (None unless with_bounds is set).
+    """
+    coords = _worker_state["coords"]
+    start = indices[0]
+    stop = indices[-1] + 1
+    if with_bounds:
+        counts, index, blocked = station_block_stats(coords, start, stop)
+        return indices, counts, (index, blocked)
+    w, h = _worker_state["size"]
+    return indices, count_visible_block(coords, start, stop, w, h), None
 
 class AsteroidMap(object):
     def __init__(self, inmap):
         self.map = [list(line.strip()) for line in inmap]
+        # visibility index, see build_visibility_index
+        self.coords = None
+        self.rays = None
+        self.nearest = None
+        self.visible = None
+        self.asteroid_ids = None
+        # set by find_best_asteroid_parallel
+        self.stations_evaluated = None
+        self.stations_bounded = None
 
-    def asteroid_angles(self, x0, y0):
-        """generator to calculate sight angles to other asteroids.
+    def asteroid_coordinates(self):
+        """return an (n, 2) array of asteroid (x, y) coordinates.
 
-        calculates angle from asteroid at (x0,y0) to other asteroids in the
-        asteroid map.
+        asteroids are listed in reading order (row by row).
+        """
+        coords = [(x, y) for y, row in enumerate(self.map)
+                  for x, col in enumerate(row) if col == "#"]
+        return np.array(coords, dtype=np.int64).reshape(-1, 2)
 
-        angles are flipped/rotated so up is an angle of 0, and right is pi/2.
+    def visible_counts(self, coords=None, max_block_elements=1 << 22):
+        """count visible asteroids from every asteroid at once.
 
-        returns angle and the coordinates of the asteroid.
+        Stations are counted a block at a time with count_visible_block.
+
+        returns an array of counts, aligned with coords (which defaults to
+        asteroid_coordinates()).
         """
-        for y, row in enumerate(self.map):
-            for x, col in enumerate(row):
-                if self.map[y][x] == "#" and not (y == y0 and x == x0):
-                    angle = atan2(y - y0, x - x0) + pi / 2
-                    if angle < 0:
-                        angle += 2*pi
-                    yield angle, (x, y)
+        if coords is None:
+            coords = self.asteroid_coordinates()
+        n = len(coords)
+        counts = np.zeros(n, dtype=np.int64)
+        if n < 2:
+            return counts
+        w = int(coords[:, 0].max() - coords[:, 0].min())
+        h = int(coords[:, 1].max() - coords[:, 1].min())
+        block = max(1, max_block_elements // n)
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            counts[start:stop] = count_visible_block(coords, start, stop, w, h)
+        return counts
 
     def count_visible_asteroids(self, x0, y0):
         """count asteroids visible from the asteroid at location (x0, y0)."""
-        return len(set([w for w, _ in self.asteroid_angles(x0, y0)]))
+        directions = set()
+        for y, row in enumerate(self.map):
+            for x, col in enumerate(row):
+                if col == "#" and not (y == y0 and x == x0):
+                    directions.add(reduce_direction(x - x0, y - y0))
+        return len(directions)
 
     def find_best_asteroid(self):
         """find the asteroid with best visibility of other asteroids.
@@ -35,60 +200,268 @@ class AsteroidMap(object):
         return the coordinates of the best asteroid and the number of other
         asteroids in its line-of-sight.
         """
-        max_vis = 0
-        max_x = 0
-        max_y = 0
-        for y, row in enumerate(self.map):
-            for x, col in enumerate(row):
-                if self.map[y][x] == "#":
-                    vis = self.count_visible_asteroids(x, y)
-                    if vis > max_vis:
-                        max_vis = vis
-                        max_x = x
-                        max_y = y
+        coords = self.asteroid_coordinates()
+        if len(coords) == 0:
+            return (0, 0), 0
+        counts = self.visible_counts(coords)
+        best = int(np.argmax(counts))
+        return (int(coords[best, 0]), int(coords[best, 1])), int(counts[best])
+
+    def _ray_keys(self, stations, dx, dy):
+        """pack station indices and ray directions into sortable integer keys"""
+        h = len(self.map)
+        w = max(len(row) for row in self.map)
+        return (stations * ((2 * w - 1) * (2 * h - 1))
+                + (dx + w - 1) * (2 * h - 1) + (dy + h - 1))
+
+    def build_visibility_index(self, max_block_elements=1 << 22):
+        """index every station's lines of sight for incremental updates.
+
+        For every station and every direction it sees an asteroid in, only
+        the nearest asteroid along that ray is stored: self.rays holds the
+        sorted (station, direction) keys and self.nearest the index (into
+        self.coords) of the nearest asteroid on each ray, or -1 once the ray
+        is empty. self.visible holds each station's visible count (-1 once it
+        has been removed), and self.asteroid_ids maps [y, x] to the index of
+        the asteroid there, or -1.
+        """
+        coords = self.asteroid_coordinates()
+        n = len(coords)
+        self.coords = coords
+        self.asteroid_ids = np.full((len(self.map), max(len(row) for row in self.map)),
+                                    -1, dtype=np.int64)
+        self.asteroid_ids[coords[:, 1], coords[:, 0]] = np.arange(n)
+        rays = []
+        nearest = []
+        self.visible = np.zeros(n, dtype=np.int64)
+        xs = coords[:, 0]
+        ys = coords[:, 1]
+        steps = len(self.map) + self.asteroid_ids.shape[1]
+        block = max(1, max_block_elements // max(n, 1))
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            dx = xs[np.newaxis, :] - xs[start:stop, np.newaxis]
+            dy = ys[np.newaxis, :] - ys[start:stop, np.newaxis]
+            g = np.gcd(dx, dy)
+            stations, targets = np.nonzero(g)
+            g = g[stations, targets]
+            keys = self._ray_keys(stations + start, dx[stations, targets] // g,
+                                  dy[stations, targets] // g)
+            # order each ray by distance and keep its first asteroid
+            order = np.argsort(keys * steps + g)
+            keys = keys[order]
+            first = np.ones(len(keys), dtype=bool)
+            first[1:] = keys[1:] != keys[:-1]
+            rays.append(keys[first])
+            nearest.append(targets[order][first].astype(np.int32))
+            self.visible[start:stop] = np.bincount(stations[order][first],
+                                                   minlength=stop - start)
+        self.rays = np.concatenate(rays) if rays else np.zeros(0, dtype=np.int64)
+        self.nearest = (np.concatenate(nearest) if nearest
+                        else np.zeros(0, dtype=np.int32))
+
+    def remove_asteroid(self, x, y):
+        """remove the asteroid at (x, y) from the map.
+
+        If the visibility index has been built, each station only looks at
+        the one ray that pointed at the removed asteroid, and only if that
+        asteroid was the nearest on it; the next nearest is then found by
+        stepping along the ray on the map. A station's count drops only if
+        that ray is now empty. returns the list of stations whose visible
+        count changed.
+        """
+        if not (0 <= y < len(self.map) and 0 <= x < len(self.map[y])
+                and self.map[y][x] == "#"):
+            raise Exception("no asteroid at ({}, {}) to remove".format(x, y))
+        self.map[y][x] = "."
+        if self.rays is None:
+            return []
+        removed = self.asteroid_ids[y, x]
+        self.asteroid_ids[y, x] = -1
+        self.visible[removed] = -1
+        stations = np.flatnonzero(self.visible >= 0)
+        dx = x - self.coords[stations, 0]
+        dy = y - self.coords[stations, 1]
+        g = np.gcd(dx, dy)
+        step_x = dx // g
+        step_y = dy // g
+        rays = np.searchsorted(self.rays, self._ray_keys(stations, step_x, step_y))
+        hit = self.nearest[rays] == removed
+        stations = stations[hit]
+        rays = rays[hit]
+        step_x = step_x[hit]
+        step_y = step_y[hit]
+        # walk every affected ray outward until it meets an asteroid or
+        # leaves the map
+        h, w = self.asteroid_ids.shape
+        cx = np.full(len(stations), x, dtype=np.int64)
+        cy = np.full(len(stations), y, dtype=np.int64)
+        pending = np.arange(len(stations))
+        while len(pending):
+            cx[pending] += step_x[pending]
+            cy[pending] += step_y[pending]
+            inside = ((cx[pending] >= 0) & (cx[pending] < w)
+                      & (cy[pending] >= 0) & (cy[pending] < h))
+            ids = np.full(len(pending), -1, dtype=np.int64)
+            ids[inside] = self.asteroid_ids[cy[pending][inside], cx[pending][inside]]
+            found = ids >= 0
+            self.nearest[rays[pending[found]]] = ids[found]
+            empty = pending[~inside]
+            self.nearest[rays[empty]] = -1
+            self.visible[stations[empty]] -= 1
+            pending = pending[inside & ~found]
+        return [(int(self.coords[i, 0]), int(self.coords[i, 1]))
+                for i in stations[self.nearest[rays] < 0]]
 
-        return (max_x, max_y), max_vis
+    def best_station(self):
+        """find_best_asteroid, answered from the visibility index"""
+        if self.visible is None or len(self.visible) == 0 or self.visible.max() < 0:
+            return (0, 0), 0
+        # argmax picks the first asteroid in reading order on ties
+        best = int(np.argmax(self.visible))
+        return ((int(self.coords[best, 0]), int(self.coords[best, 1])),
+                int(self.visible[best]))
+
+    def find_best_asteroid_parallel(self, processes=None, block_size=16,
+                                    bound_allowance=None):
+        """find_best_asteroid, spreading the candidate stations over processes.
+
+        The asteroid coordinates are placed in shared memory once rather
+        than being sent with every task, and candidates are counted with the
+        same kernel as the serial search. Candidates can be skipped using
+        lower bounds on how many asteroids each asteroid cannot see (see
+        station_block_stats): one whose upper bound (the number of other
+        asteroids minus those blockers) cannot beat the best count so far is
+        never evaluated. The bounds cost more to work out than the counts, so
+        a block only gets them while they pay off: after bound_allowance
+        stations (a twentieth of the asteroids by default), every station
+        evaluated with bounds has to be matched by a skipped candidate. The
+        numbers of stations evaluated, and evaluated with bounds, are kept in
+        self.stations_evaluated and self.stations_bounded.
+        """
+        coords = self.asteroid_coordinates()
+        n = len(coords)
+        if n < 2:
+            return self.find_best_asteroid()
+        if processes is None:
+            processes = cpu_count()
+        if bound_allowance is None:
+            bound_allowance = max(block_size, n // 20)
+
+        # shared_memory needs python 3.8
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=coords.nbytes)
+        shared = np.ndarray(coords.shape, dtype=coords.dtype, buffer=shm.buf)
+        shared[:] = coords
+        pool = Pool(processes, _init_station_worker, (shm.name, n))
+        try:
+            blockers = np.zeros(n, dtype=np.int64)
+            best = -1
+            best_index = n
+            evaluated = 0
+            bounded = 0
+            skipped = 0
+
+            def can_win(index):
+                # ties go to the first asteroid in reading order
+                bound = n - 1 - blockers[index]
+                return bound > best or (bound == best and index < best_index)
+
+            next_candidate = 0
+            in_flight = []
+            while next_candidate < n or in_flight:
+                # keep a couple of blocks queued per worker
+                while next_candidate < n and len(in_flight) < 2 * processes:
+                    block = []
+                    while next_candidate < n and len(block) < block_size:
+                        if can_win(next_candidate):
+                            block.append(next_candidate)
+                        else:
+                            skipped += 1
+                        next_candidate += 1
+                    with_bounds = bounded < bound_allowance + skipped
+                    if with_bounds:
+                        bounded += len(block)
+                    # split into contiguous runs of candidates
+                    runs = []
+                    for index in block:
+                        if runs and runs[-1][-1] == index - 1:
+                            runs[-1].append(index)
+                        else:
+                            runs.append([index])
+                    for run in runs:
+                        in_flight.append(pool.apply_async(_station_task,
+                                                          (run, with_bounds)))
+                if not in_flight:
+                    break
+                indices, block_counts, bounds = in_flight.pop(0).get()
+                evaluated += len(indices)
+                if bounds is not None:
+                    blockers[bounds[0]] += bounds[1]
+                for index, count in zip(indices, block_counts):
+                    if count > best or (count == best and index < best_index):
+                        best = int(count)
+                        best_index = index
+            self.stations_evaluated = evaluated
+            self.stations_bounded = bounded
+        finally:
+            pool.close()
+            pool.join()
+            del shared
+            shm.close()
+            shm.unlink()
+
+        return (int(coords[best_index, 0]), int(coords[best_index, 1])), best
 
 class AsteroidDefenseLaser(object):
     def __init__(self, asteroid_map, x0, y0):
         self.location = (x0, y0)
-        self.current_angle_index = -1
-
-        # mapping of angles to list of asteroid coordinates along that vector
-        self.angles_to_asteroids = defaultdict(list)
-        for w, xy in asteroid_map.asteroid_angles(
-                self.location[0], self.location[1]):
-            self.angles_to_asteroids[w].append(xy)
-        # sort asteroid coordinates by distance
-        for w in self.angles_to_asteroids:
-            self.angles_to_asteroids[w] = sorted(self.angles_to_asteroids[w], key=self.dist)
-        # list of angles to sweep through in order
-        self.angles = sorted(self.angles_to_asteroids.keys())
-
-    def dist(self, coords):
-        return sqrt((self.location[0] - coords[0])**2
-                + (self.location[1] - coords[1])**2)
-
-    def check_target_exists(self):
-        if self.angles_to_asteroids[self.angles[self.current_angle_index]]:
-            return True
-        else:
-            return False
+        self.shots = 0
+
+        # the laser sweeps clockwise from straight up, hitting the nearest
+        # remaining asteroid in each direction, so an asteroid is vaporized
+        # in sweep number (its depth along its ray) and then in angle order
+        coords = asteroid_map.asteroid_coordinates()
+        coords = coords[(coords[:, 0] != x0) | (coords[:, 1] != y0)]
+        dx = coords[:, 0] - x0
+        dy = coords[:, 1] - y0
+        g = np.gcd(dx, dy)
+        step_x = dx // g
+        step_y = dy // g
+        # angles are flipped/rotated so up is an angle of 0, and right is
+        # pi/2. they are computed from the reduced direction, so asteroids on
+        # the same ray get exactly the same angle.
+        angles = np.arctan2(step_y, step_x) + pi / 2
+        angles[angles < 0] += 2 * pi
+        # rank asteroids along each ray by distance
+        by_ray = np.lexsort((g, step_y, step_x))
+        new_ray = np.ones(len(by_ray), dtype=bool)
+        new_ray[1:] = ((step_x[by_ray][1:] != step_x[by_ray][:-1])
+                       | (step_y[by_ray][1:] != step_y[by_ray][:-1]))
+        ray_starts = np.flatnonzero(new_ray)
+        depth = np.empty(len(by_ray), dtype=np.int64)
+        depth[by_ray] = (np.arange(len(by_ray))
+                         - ray_starts[np.cumsum(new_ray) - 1])
+        # the full vaporization order, as an (n, 2) array of coordinates
+        self.order = coords[np.lexsort((angles, depth))]
 
-    def pick_next_target(self):
-        def next_angle_index():
-            return (self.current_angle_index + 1) % len(self.angles)
+    def nth_target(self, n):
+        """return the coordinates of the nth asteroid vaporized (1-based)"""
+        if not 1 <= n <= len(self.order):
+            raise Exception("no target {}; there are {} targets"
+                            .format(n, len(self.order)))
+        x, y = self.order[n - 1]
+        return int(x), int(y)
 
-        # increment target
-        self.current_angle_index = next_angle_index()
-        # check if any asteroids remain along that vector; if not, go to next target
-        while not self.check_target_exists():
-            self.current_angle_index = next_angle_index()
+    def iter_targets(self):
+        """generate the coordinates of asteroids in vaporization order"""
+        for x, y in self.order:
+            yield int(x), int(y)
 
     def fire_lazer(self):
         # hello 2007
-        self.pick_next_target()
-        return self.angles_to_asteroids[self.angles[self.current_angle_index]].pop(0)
+        self.shots += 1
+        return self.nth_target(self.shots)
 
 def test():
     inmaps = [
@@ -155,9 +528,12 @@ def test():
               ]
     goal_coords = [(3, 4),(5,8),(1,2),(6,3),(11,13)]
     goal_asteroids = [8,33,35,41,210]
+    big_map = inmaps[4]
     for n, inmap in enumerate(inmaps):
         amap = AsteroidMap(inmap)
         coords, asteroids = amap.find_best_asteroid()
+        if amap.find_best_asteroid_parallel(processes=2, block_size=8) != (coords, asteroids):
+            print("test{} failed: parallel search disagrees".format(n))
         if goal_coords[n] == coords and goal_asteroids[n] == asteroids:
             print("test{} passed".format(n))
         else:
@@ -169,6 +545,18 @@ def test():
             print("calculated visible asteroids at expected location: {}"
                     .format(amap.count_visible_asteroids(goal_coords[n][0],
                         goal_coords[n][1])))
+    amap = AsteroidMap(big_map)
+    n = len(amap.asteroid_coordinates())
+    # with bounds on every block, some candidates are skipped
+    amap.find_best_asteroid_parallel(processes=2, block_size=8, bound_allowance=n)
+    if amap.stations_evaluated >= n:
+        print("parallel search test failed: no candidate stations were skipped")
+    # by default, bounds that skip nothing stop being worked out (the last
+    # block given bounds may run past the allowance)
+    amap.find_best_asteroid_parallel(processes=2, block_size=8)
+    if amap.stations_bounded > n // 20 + 8 + n - amap.stations_evaluated:
+        print("parallel search test failed: {} stations evaluated with bounds"
+              .format(amap.stations_bounded))
     amap = AsteroidMap([".##",
                         ".##",
                         "#.."])
@@ -187,6 +575,33 @@ def test():
             hit = adl.fire_lazer()
             if hit != target:
                 print("test {} failed, destroyed {} instead of {}".format(n, hit, target))
+    amap = AsteroidMap(big_map)
+    amap.build_visibility_index()
+    adl = AsteroidDefenseLaser(amap, 11, 13)
+    for n, target in enumerate(adl.iter_targets()):
+        if n == 150:
+            break
+        amap.remove_asteroid(*target)
+        if amap.best_station() != amap.find_best_asteroid():
+            print("visibility index test failed after removing {}".format(target))
+            break
+    try:
+        amap.remove_asteroid(11, 13)
+        amap.remove_asteroid(11, 13)
+        print("visibility index test failed: removed an empty cell")
+    except Exception:
+        if amap.map[13][11] != "." or amap.best_station() != amap.find_best_asteroid():
+            print("visibility index test failed: bad removal changed the map")
+    for n, target in [(1, (11, 12)), (50, (16, 9)), (200, (8, 2)), (299, (11, 1))]:
+        hit = adl.nth_target(n)
+        if hit != target:
+            print("laser test failed, target {} was {} instead of {}".format(n, hit, target))
+    for n in [0, -1, 300]:
+        try:
+            adl.nth_target(n)
+            print("laser test failed, target {} did not raise".format(n))
+        except Exception:
+            pass
 
 if __name__ == "__main__":
     test()
@@ -198,8 +613,7 @@ if __name__ == "__main__":
     print("best asteroid is at {}; {} asteroids visible".format(coords, asteroids))
     # part 2
     adl = AsteroidDefenseLaser(amap, coords[0], coords[1])
-    for _ in range(200):
-        hit = adl.fire_lazer()
+    hit = adl.nth_target(200)
     print("200th asteroid hit: {}; code: {}".format(hit, hit[0] * 100 + hit[1]))
 
 
@@ -4,6 +4,8 @@ from __future__ import print_function, division
 from collections import defaultdict
 from copy import copy
 
+import numpy as np
+
 """
 1. input color of current tile (0 = black, 1 = white) (all tiles start black)
 2. program outputs color to paint tile (0 = black, 1 = white)
@@ -25,26 +27,281 @@ direction_vector = {
         "right": (1, 0)
         }
 
+class Grid(object):
+    """2D grid of values indexed by (x, y) tuples.
+
+    The grid starts out as a sparse dict. If a numpy dtype is given, it
+    switches to a numpy array (offset so that it can hold negative
+    coordinates) once the fraction of set cells in its bounding box reaches
+    density, after which counting, searching and rendering are vectorized.
+    If a write outside the array would grow the bounding box past that
+    density, the grid goes back to a sparse dict instead of reallocating.
+    The bounding box of the set cells is updated as cells are set, so it never
+    has to be found by scanning every key.
+
+    Reading a cell that has not been set returns default without inserting it
+    (unlike a defaultdict). If default is None, a KeyError is raised instead.
+    """
+
+    def __init__(self, default=None, dtype=None, density=0.5,
+                 min_dense_cells=64):
+        self.default = default
+        self.dtype = dtype
+        self.density = density
+        self.min_dense_cells = min_dense_cells
+        self.cells = {}     # sparse storage
+        self.array = None   # dense storage
+        self.mask = None    # which elements of the dense array are set
+        self.origin = None  # (x, y) location of dense array element [0, 0]
+        self.bounds = None  # (xmin, xmax, ymin, ymax) of the set cells
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, loc):
+        if self.array is None:
+            return loc in self.cells
+        index = self._array_index(loc)
+        return index is not None and bool(self.mask[index])
+
+    def __getitem__(self, loc):
+        if self.array is None:
+            if loc in self.cells:
+                return self.cells[loc]
+        else:
+            index = self._array_index(loc)
+            if index is not None and self.mask[index]:
+                return self.array[index].item()
+        if self.default is None:
+            raise KeyError(loc)
+        return self.default
+
+    def __setitem__(self, loc, value):
+        x, y = loc
+        if self.bounds is None:
+            self.bounds = (x, x, y, y)
+        else:
+            xmin, xmax, ymin, ymax = self.bounds
+            self.bounds = (min(x, xmin), max(x, xmax), min(y, ymin), max(y, ymax))
+
+        if self.array is None:
+            if loc not in self.cells:
+                self.size += 1
+            self.cells[loc] = value
+            self._maybe_densify()
+        else:
+            index = self._array_index(loc)
+            if index is None:
+                if not self._dense_enough(self.size + 1):
+                    # an outlier; a dense array covering it would be mostly empty
+                    self._sparsify()
+                    self.size += 1
+                    self.cells[loc] = value
+                    return
+                self._allocate()
+                index = self._array_index(loc)
+            if not self.mask[index]:
+                self.size += 1
+                self.mask[index] = True
+            self.array[index] = value
+
+    def _array_index(self, loc):
+        """convert a location to a dense array index, or None if outside"""
+        row = loc[1] - self.origin[1]
+        col = loc[0] - self.origin[0]
+        if 0 <= row < self.array.shape[0] and 0 <= col < self.array.shape[1]:
+            return row, col
+        return None
+
+    def _allocate(self):
+        """(re)allocate the dense arrays around the bounding box.
+
+        The arrays are padded by half the bounding box in each direction so
+        that a growing grid is only reallocated a logarithmic number of times.
+        """
+        xmin, xmax, ymin, ymax = self.bounds
+        h = ymax - ymin + 1
+        w = xmax - xmin + 1
+        origin = (xmin - (w // 2 + 1), ymin - (h // 2 + 1))
+        array = np.zeros((h + 2 * (h // 2 + 1), w + 2 * (w // 2 + 1)),
+                         dtype=self.dtype)
+        mask = np.zeros(array.shape, dtype=bool)
+        if self.array is not None:
+            row = self.origin[1] - origin[1]
+            col = self.origin[0] - origin[0]
+            rows, cols = self.array.shape
+            array[row:row + rows, col:col + cols] = self.array
+            mask[row:row + rows, col:col + cols] = self.mask
+        self.array = array
+        self.mask = mask
+        self.origin = origin
+
+    def _dense_enough(self, size):
+        """whether size set cells fill enough of the bounding box for an array"""
+        if size < self.min_dense_cells:
+            return False
+        xmin, xmax, ymin, ymax = self.bounds
+        return size >= self.density * (xmax - xmin + 1) * (ymax - ymin + 1)
+
+    def _maybe_densify(self):
+        """switch from sparse to dense storage once the grid is dense enough"""
+        if self.dtype is None or not self._dense_enough(self.size):
+            return
+        self._allocate()
+        for (x, y), value in self.cells.items():
+            index = (y - self.origin[1], x - self.origin[0])
+            self.array[index] = value
+            self.mask[index] = True
+        self.cells = {}
+
+    def _sparsify(self):
+        """switch from dense back to sparse storage"""
+        self.cells = dict(self.items())
+        self.array = None
+        self.mask = None
+        self.origin = None
+
+    def keys(self):
+        if self.array is None:
+            return list(self.cells)
+        rows, cols = np.nonzero(self.mask)
+        return [(int(c) + self.origin[0], int(r) + self.origin[1])
+                for r, c in zip(rows, cols)]
+
+    def values(self):
+        if self.array is None:
+            return list(self.cells.values())
+        return self.array[self.mask].tolist()
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def extents(self):
+        """return (xmin, xmax, ymin, ymax) of the set cells, or None if empty"""
+        return self.bounds
+
+    def window(self, bounds=None):
+        """return arrays of values and set-cell flags covering bounds.
+
+        bounds is an inclusive (xmin, xmax, ymin, ymax) tuple and defaults to
+        the extents of the grid (empty arrays if the grid is empty). Both
+        arrays are indexed as [y - ymin, x - xmin].
+        """
+        if bounds is None:
+            bounds = self.bounds
+        if bounds is None:
+            return (np.zeros((0, 0), dtype=self.dtype if self.dtype else object),
+                    np.zeros((0, 0), dtype=bool))
+        xmin, xmax, ymin, ymax = bounds
+        shape = (ymax - ymin + 1, xmax - xmin + 1)
+        values = np.zeros(shape, dtype=self.dtype if self.dtype else object)
+        mask = np.zeros(shape, dtype=bool)
+        if self.array is None:
+            for (x, y), value in self.cells.items():
+                if xmin <= x <= xmax and ymin <= y <= ymax:
+                    values[y - ymin, x - xmin] = value
+                    mask[y - ymin, x - xmin] = True
+        else:
+            # copy the overlap between bounds and the dense array
+            rows, cols = self.array.shape
+            r0 = max(ymin - self.origin[1], 0)
+            r1 = min(ymax - self.origin[1] + 1, rows)
+            c0 = max(xmin - self.origin[0], 0)
+            c1 = min(xmax - self.origin[0] + 1, cols)
+            if r0 < r1 and c0 < c1:
+                dest = (slice(r0 + self.origin[1] - ymin, r1 + self.origin[1] - ymin),
+                        slice(c0 + self.origin[0] - xmin, c1 + self.origin[0] - xmin))
+                values[dest] = self.array[r0:r1, c0:c1]
+                mask[dest] = self.mask[r0:r1, c0:c1]
+        return values, mask
+
+    def count(self, value):
+        """count set cells holding value"""
+        if self.array is None:
+            return sum(1 for v in self.cells.values() if v == value)
+        return int(np.count_nonzero((self.array == value) & self.mask))
+
+    def find(self, value):
+        """return the locations of all set cells holding value"""
+        if self.array is None:
+            return [loc for loc, v in self.cells.items() if v == value]
+        rows, cols = np.nonzero((self.array == value) & self.mask)
+        return [(int(c) + self.origin[0], int(r) + self.origin[1])
+                for r, c in zip(rows, cols)]
+
+    def neighbors(self, loc):
+        """return (location, value) pairs for the set cells next to loc"""
+        x, y = loc
+        return [(n, self[n]) for n in [(x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)]
+                if n in self]
+
+    def neighbor_counts(self, value, bounds=None):
+        """count, for every cell in bounds, the adjacent set cells holding value.
+
+        returns an int array indexed like window(bounds).
+        """
+        values, mask = self.window(bounds)
+        match = (mask & (values == value)).astype(np.int64)
+        counts = np.zeros_like(match)
+        counts[1:, :] += match[:-1, :]
+        counts[:-1, :] += match[1:, :]
+        counts[:, 1:] += match[:, :-1]
+        counts[:, :-1] += match[:, 1:]
+        return counts
+
+    def render(self, lookup, blank=" ", marks=None, bounds=None):
+        """render the grid as a list of strings, one per row.
+
+        lookup is either a dict of value: character pairs or a function from
+        value to character. Unset cells (and values missing from a lookup
+        dict) are drawn as blank. marks is an optional dict of location:
+        character pairs drawn on top. An empty grid renders as no rows.
+        """
+        if bounds is None:
+            bounds = self.bounds
+        if bounds is None:
+            return []
+        xmin, xmax, ymin, ymax = bounds
+        values, mask = self.window(bounds)
+        chars = np.full(values.shape, blank, dtype="<U1")
+        if callable(lookup):
+            for row, col in zip(*np.nonzero(mask)):
+                chars[row, col] = lookup(values[row, col])
+        else:
+            for value, char in lookup.items():
+                chars[mask & (values == value)] = char
+        for (x, y), char in (marks or {}).items():
+            if xmin <= x <= xmax and ymin <= y <= ymax:
+                chars[y - ymin, x - xmin] = char
+        return ["".join(row) for row in chars]
+
 class PaintingRobot(object):
     def __init__(self, raw_intcodes):
         self.computer = IntcodeComputer(raw_intcodes)
         self.location = (0, 0)
         self.direction = "up"
-        self.painted_tiles = defaultdict(int) # default 0 (black)
+        self.painted_tiles = Grid(default=0, dtype=np.int8) # default 0 (black)
+        self.pending_outputs = []
 
     def count_painted_tiles(self):
         """return number of tiles painted at least once"""
         return len(self.painted_tiles)
 
-    def step(self):
-        # add appropriate inputs
-        self.computer.add_to_input_queue([self.painted_tiles[self.location]])
-        _, pc = self.computer.run_program()
+    def camera(self):
+        """input provider: report the color of the current tile"""
+        return self.painted_tiles[self.location]
 
-        # read outputs
-        outputs = self.computer.get_outputs()
-        color = outputs[0]
-        turn = outputs[1]
+    def handle_output(self, value):
+        """output consumer: outputs alternate between a color and a turn"""
+        self.pending_outputs.append(value)
+        if len(self.pending_outputs) < 2:
+            return
+        color, turn = self.pending_outputs
+        self.pending_outputs = []
 
         # update internal state
         self.painted_tiles[self.location] = color
@@ -52,42 +309,34 @@ class PaintingRobot(object):
         self.location = (self.location[0] + direction_vector[self.direction][0],
                          self.location[1] + direction_vector[self.direction][1])
 
-        # if pc is None, program halted and painting is complete
-        return pc is not None
-
     def run(self, start_on_white=False):
         if start_on_white:
             self.painted_tiles[self.location] = 1
-        while self.step():
-            pass
+        # the computer asks for and reports every panel through the callbacks,
+        # so the whole painting session is a single run
+        self.computer.input_provider = self.camera
+        self.computer.output_consumer = self.handle_output
+        self.computer.run_program()
         print("finished painting {} tiles".format(self.count_painted_tiles()))
 
     def display(self):
-        # determine dimensions of painted area
-        xmin = xmax = ymin = ymax = 0
-        for x, y in self.painted_tiles:
-            xmin = min(x, xmin)
-            xmax = max(x, xmax)
-            ymin = min(y, ymin)
-            ymax = max(y, ymax)
-
-        for y in range(ymin, ymax + 1):
-            row = []
-            for x in range(xmin, xmax + 1):
-                if ((x, y) in self.painted_tiles
-                        and self.painted_tiles[(x, y)] == 1): # white
-                    row.append("o")
-                else:
-                    row.append(" ")
-            print("".join(row))
+        # white tiles are drawn as "o"; black and unpainted tiles are blank
+        for row in self.painted_tiles.render({1: "o"}):
+            print(row)
 
 
 class IntcodeComputer(object):
-    def __init__(self, raw_intcode_list, initial_inputs=[]):
+    def __init__(self, raw_intcode_list, initial_inputs=[],
+                 input_provider=None, output_consumer=None):
         self.pc = 0 # program counter
         self.rb = 0 # relative base
         self.input_queue = initial_inputs
         self.output_queue = []
+        # optional callables used instead of the queues: input_provider() is
+        # called for each input once the input queue is empty (returning None
+        # pauses the program), and output_consumer(value) receives each output
+        self.input_provider = input_provider
+        self.output_consumer = output_consumer
         self.intcodes = self.intcodes_from_list(raw_intcode_list)
 
     def intcodes_from_list(self, intcode_list):
@@ -118,7 +367,7 @@ class IntcodeComputer(object):
         self.output_queue = []
         return outlist
 
-    def run_program(self):
+    def run_program(self, max_outputs=None, stop=None):
         """run intcodes, which are stored as a dict of step: intcode pairs
 
         intcodes encode the operation as well as the parameter mode. The two least
@@ -127,6 +376,10 @@ class IntcodeComputer(object):
         is 1st parameter, thousands place is 2nd parameter, etc.)
         parameter mode 0: parameters is a position (an address)
         parameter mode 1: parameter is immediate (a literal value)
+
+        The program pauses (returning the intcodes and the program counter to
+        resume from) when it needs an input that is not available, after
+        max_outputs outputs, or when stop(output) returns True for an output.
         """
 
         num_params = {
@@ -179,6 +432,7 @@ class IntcodeComputer(object):
             return parameters
 
         last = len(self.intcodes) - 1
+        outputs = 0
 
         while self.pc <= last:
             op, param_modes = decode_intcode(self.intcodes[self.pc])
@@ -198,17 +452,31 @@ class IntcodeComputer(object):
                 # store input at address of parameter
                 check_remaining_opcodes()
                 args = get_parameters()
+                if self.input_queue:
+                    value = self.input_queue.pop(0)
+                elif self.input_provider is not None:
+                    value = self.input_provider()
+                else:
+                    value = None
                 # if no input is available, return
-                if len(self.input_queue) == 0:
+                if value is None:
                     return self.intcodes, self.pc
-                self.intcodes[args[0]] = int(self.input_queue.pop(0))
+                self.intcodes[args[0]] = int(value)
                 self.pc += num_params[op] + 1
             elif op == 4:
                 # print value at address of parameter
                 check_remaining_opcodes()
                 args = get_parameters()
-                self.output_queue.append(self.intcodes[args[0]])
+                value = self.intcodes[args[0]]
+                if self.output_consumer is not None:
+                    self.output_consumer(value)
+                else:
+                    self.output_queue.append(value)
                 self.pc += num_params[op] + 1
+                outputs += 1
+                if ((max_outputs is not None and outputs >= max_outputs)
+                        or (stop is not None and stop(value))):
+                    return self.intcodes, self.pc
             elif op == 5:
                 # jump if true (jump address in 2nd parameter)
                 check_remaining_opcodes()
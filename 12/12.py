@@ -4,7 +4,13 @@ from __future__ import print_function, division
 from itertools import combinations
 from functools import reduce
 from copy import copy
+from multiprocessing import Pool
+import os
 import re
+import shutil
+import tempfile
+
+import numpy as np
 
 class Moon(object):
     def __init__(self, position):
@@ -37,6 +43,106 @@ def parse_input_into_moons(input_lines):
         moons.append(Moon([int(result.group(n)) for n in range(1, 4)]))
     return moons
 
+def parse_input_into_positions(input_lines):
+    """parse moon positions into an (N, 3) int64 array"""
+    return np.array([moon.position for moon in parse_input_into_moons(input_lines)],
+                    dtype=np.int64)
+
+def pairwise_gravity(position):
+    """velocity change for each moon from every pair of moons, O(N^2)."""
+    # element [i, j] is the position of moon j relative to moon i
+    d = position[np.newaxis, :, :] - position[:, np.newaxis, :]
+    return np.sign(d).sum(axis=1)
+
+def sorted_gravity(position):
+    """velocity change for each moon from per-axis sorting, O(N log N).
+
+    On each axis a moon speeds up by one for every moon ahead of it and
+    slows down by one for every moon behind it, so only the number of moons
+    strictly greater and strictly less than it are needed. Both come from
+    its insertion points in the sorted axis (moons at the same position
+    pull in neither direction).
+    """
+    n = len(position)
+    delta = np.empty_like(position)
+    ordered = np.sort(position, axis=0)
+    for axis in range(position.shape[1]):
+        less = np.searchsorted(ordered[:, axis], position[:, axis], side="left")
+        not_greater = np.searchsorted(ordered[:, axis], position[:, axis], side="right")
+        delta[:, axis] = (n - not_greater) - less
+    return delta
+
+class MoonSystem(object):
+    """all moons' positions and velocities, held as (N, 3) int64 arrays.
+
+    Each timestep applies gravity between all moons at once, then velocity.
+    gravity selects the kernel: "pairwise" sums the signs of the pairwise
+    position differences, "sorted" counts moons ahead and behind from sorted
+    axes. By default, systems with more than sorted_gravity_threshold moons
+    use the sorted kernel.
+    """
+
+    sorted_gravity_threshold = 64
+
+    def __init__(self, positions, velocities=None, gravity=None):
+        self.position = np.array(positions, dtype=np.int64)
+        if velocities is None:
+            self.velocity = np.zeros_like(self.position)
+        else:
+            self.velocity = np.array(velocities, dtype=np.int64)
+        if gravity is None:
+            if len(self.position) > self.sorted_gravity_threshold:
+                gravity = "sorted"
+            else:
+                gravity = "pairwise"
+        kernels = {"pairwise": pairwise_gravity, "sorted": sorted_gravity}
+        if gravity not in kernels:
+            raise Exception("invalid gravity kernel: {}".format(gravity))
+        self.gravity = kernels[gravity]
+
+    def copy(self):
+        system = copy(self)
+        system.position = self.position.copy()
+        system.velocity = self.velocity.copy()
+        return system
+
+    def axis(self, n):
+        """return a copy of the system restricted to one axis"""
+        system = self.copy()
+        system.position = self.position[:, n:n + 1].copy()
+        system.velocity = self.velocity[:, n:n + 1].copy()
+        return system
+
+    def same_state(self, other):
+        return (np.array_equal(self.position, other.position)
+                and np.array_equal(self.velocity, other.velocity))
+
+    def apply_gravity(self):
+        self.velocity += self.gravity(self.position)
+
+    def apply_velocity(self):
+        self.position += self.velocity
+
+    def timestep(self, steps=1):
+        for _ in range(steps):
+            self.apply_gravity()
+            self.apply_velocity()
+
+    def moons(self):
+        """return Moon objects viewing (not copying) each moon's state"""
+        moons = []
+        for n in range(len(self.position)):
+            moon = Moon([0, 0, 0])
+            moon.position = self.position[n]
+            moon.velocity = self.velocity[n]
+            moons.append(moon)
+        return moons
+
+    def total_energy(self):
+        potential = np.abs(self.position).sum(axis=1)
+        kinetic = np.abs(self.velocity).sum(axis=1)
+        return int((potential * kinetic).sum())
+
 def apply_gravity(moonlist):
     pairs = combinations(moonlist, 2)
     for pair in pairs:
@@ -68,24 +174,6 @@ def total_energy(moonlist):
         energy += m.calculate_total_energy()
     return energy
 
-def get_current_state(moonlist, dim):
-    # get state for one dimension (x, y, z)
-    positions = []
-    velocities = []
-    for moon in moonlist:
-        positions.append(moon.position[dim])
-        velocities.append(moon.velocity[dim])
-    return (tuple(positions), tuple(velocities))
-
-def save_state(moonlist, states, dim, step):
-    # only save state for one dimension
-    state = get_current_state(moonlist, dim)
-    if state in states:
-        return True
-    else:
-        states[state] = step
-        return False
-
 def gcd(a, b):
     if b == 0:
         return a
@@ -95,19 +183,392 @@ def lcm(a, b):
     return abs(a * b) // gcd(a, b)
 
 
-def find_repeated_state(moonlist):
+def find_cycle(system, reversible=True):
+    """find the cycle a MoonSystem's state falls into, without storing states.
+
+    returns the cycle length and the step at which the cycle is entered.
+
+    The dynamics are reversible (the previous state can be recovered from
+    the current one), so the first repeated state is always the initial
+    state and only that needs to be kept. For systems that are not
+    reversible, Brent's algorithm is used instead, which also only keeps a
+    fixed number of states. system itself is not modified.
+    """
+    if reversible:
+        current = system.copy()
+        current.timestep()
+        period = 1
+        while not current.same_state(system):
+            current.timestep()
+            period += 1
+        return period, 0
+
+    # Brent's algorithm: find the cycle length with a hare that runs ahead
+    # in doubling stretches, then find where the cycle starts
+    power = period = 1
+    tortoise = system.copy()
+    hare = system.copy()
+    hare.timestep()
+    while not tortoise.same_state(hare):
+        if power == period:
+            tortoise = hare.copy()
+            power *= 2
+            period = 0
+        hare.timestep()
+        period += 1
+    tortoise = system.copy()
+    hare = system.copy()
+    hare.timestep(period)
+    start = 0
+    while not tortoise.same_state(hare):
+        tortoise.timestep()
+        hare.timestep()
+        start += 1
+    return period, start
+
+class BatchMoonSystem(object):
+    """many independent moon systems, held as (S, N, D) int64 arrays.
+
+    All S systems (of N moons in D dimensions each) are stepped together
+    with the pairwise gravity sum, so a sweep over many starting
+    configurations runs as one array operation per step. steps holds the
+    (S,) number of steps each system has taken.
+    """
+
+    def __init__(self, positions, velocities=None):
+        self.position = np.array(positions, dtype=np.int64)
+        if velocities is None:
+            self.velocity = np.zeros_like(self.position)
+        else:
+            self.velocity = np.array(velocities, dtype=np.int64)
+        self.steps = np.zeros(len(self.position), dtype=np.int64)
+
+    def timestep(self, steps=1, active=None):
+        """step every system, or only those where the active mask is set"""
+        for _ in range(steps):
+            if active is None:
+                p = self.position
+                v = self.velocity
+            else:
+                p = self.position[active]
+                v = self.velocity[active]
+            # element [s, i, j] is the position of moon j relative to moon i
+            d = p[:, np.newaxis, :, :] - p[:, :, np.newaxis, :]
+            v += np.sign(d).sum(axis=2)
+            p += v
+            if active is not None:
+                self.position[active] = p
+                self.velocity[active] = v
+                self.steps[active] += 1
+            else:
+                self.steps += 1
+
+    def total_energy(self):
+        """return an (S,) array of the total energy of each system"""
+        potential = np.abs(self.position).sum(axis=2)
+        kinetic = np.abs(self.velocity).sum(axis=2)
+        return (potential * kinetic).sum(axis=1)
+
+    def find_periods(self, max_steps=None):
+        """find the number of steps until each system first repeats.
+
+        Like find_cycle, this relies on the dynamics being reversible, so each
+        axis of each system only needs comparing with its starting state.
+        Systems stop being stepped once all their axes have repeated, and
+        are left advanced by that many steps (see steps), so afterwards the
+        systems are generally at different step counts.
+
+        returns a list of S periods (None for systems that had not repeated
+        within max_steps) and the (S, D) array of per-axis periods.
+        """
+        start_position = self.position.copy()
+        start_velocity = self.velocity.copy()
+        axis_periods = np.zeros(self.position.shape[::2], dtype=np.int64)
+        active = np.ones(len(self.position), dtype=bool)
+        step = 0
+        while active.any() and (max_steps is None or step < max_steps):
+            self.timestep(active=active)
+            step += 1
+            index = np.flatnonzero(active)
+            repeated = ((self.position[index] == start_position[index])
+                        & (self.velocity[index] == start_velocity[index])).all(axis=1)
+            new = repeated & (axis_periods[index] == 0)
+            axis_periods[index] = np.where(new, step, axis_periods[index])
+            active[index] = (axis_periods[index] == 0).any(axis=1)
+        periods = []
+        for row in axis_periods.tolist():
+            if 0 in row:
+                periods.append(None)
+            else:
+                periods.append(reduce(lcm, row))
+        return periods, axis_periods
+
+class SimulationRunner(object):
+    """long-running period search that can be interrupted and resumed.
+
+    Every checkpoint_every steps, the step count, the current and starting
+    positions and velocities, the gravity kernel, and the per-axis periods
+    found so far are written to checkpoint_path (a numpy .npz file, replaced
+    atomically). A new runner pointed at an existing checkpoint carries on
+    from it, as long as the checkpoint was written for the same starting
+    state and kernel; otherwise an exception is raised.
+    Checkpoints are only written between whole steps; if a run is
+    interrupted, the last checkpoint is kept and the runner rewinds to it.
+
+    If energy_path is given, the total energy every energy_stride steps is
+    appended to it as raw int64 values, which can be watched while the run
+    is going with read_energy_series. The stride is saved with the
+    checkpoint, and resuming a series with a different stride raises an
+    exception.
+    """
+
+    def __init__(self, system, checkpoint_path, checkpoint_every=100000,
+                 energy_path=None, energy_stride=1):
+        self.system = system.copy()
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self.energy_path = energy_path
+        self.energy_stride = energy_stride
+        self.step = 0
+        self.start_position = self.system.position.copy()
+        self.start_velocity = self.system.velocity.copy()
+        self.axis_periods = np.zeros(self.system.position.shape[1], dtype=np.int64)
+        if os.path.exists(checkpoint_path):
+            self.load_checkpoint()
+        if energy_path is not None:
+            self._open_energy_series()
+
+    def load_checkpoint(self):
+        with np.load(self.checkpoint_path) as checkpoint:
+            if ("gravity" not in checkpoint
+                    or str(checkpoint["gravity"]) != self.system.gravity.__name__
+                    or not np.array_equal(checkpoint["start_position"], self.start_position)
+                    or not np.array_equal(checkpoint["start_velocity"], self.start_velocity)):
+                raise Exception("checkpoint {} was written for a different moon system"
+                                .format(self.checkpoint_path))
+            # 0 means the checkpointed run did not record an energy series
+            if (self.energy_path is not None
+                    and int(checkpoint.get("energy_stride", 0)) != self.energy_stride):
+                raise Exception("checkpoint {} was written with an energy stride of {}, not {}"
+                                .format(self.checkpoint_path,
+                                        int(checkpoint.get("energy_stride", 0)),
+                                        self.energy_stride))
+            self.step = int(checkpoint["step"])
+            self.system.position = checkpoint["position"]
+            self.system.velocity = checkpoint["velocity"]
+            self.start_position = checkpoint["start_position"]
+            self.start_velocity = checkpoint["start_velocity"]
+            self.axis_periods = checkpoint["axis_periods"]
+
+    def save_checkpoint(self):
+        self._flush_energy_series()
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "wb") as outfile:
+            np.savez(outfile, step=self.step,
+                     position=self.system.position,
+                     velocity=self.system.velocity,
+                     start_position=self.start_position,
+                     start_velocity=self.start_velocity,
+                     gravity=self.system.gravity.__name__,
+                     energy_stride=self.energy_stride if self.energy_path else 0,
+                     axis_periods=self.axis_periods)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _open_energy_series(self):
+        # drop any samples written after the checkpoint being resumed from
+        samples = self.step // self.energy_stride + 1
+        if self.step:
+            size = os.path.getsize(self.energy_path) if os.path.exists(self.energy_path) else 0
+            if size < 8 * samples:
+                raise Exception("energy series {} holds {} samples, checkpoint at step {} needs {}"
+                                .format(self.energy_path, size // 8, self.step, samples))
+        mode = "r+b" if os.path.exists(self.energy_path) else "wb"
+        self.energy_file = open(self.energy_path, mode)
+        self.energy_file.truncate(8 * samples if self.step else 0)
+        self.energy_file.seek(0, os.SEEK_END)
+        self.energy_buffer = []
+        if self.step == 0:
+            self.energy_buffer.append(self.system.total_energy())
+
+    def _flush_energy_series(self):
+        if self.energy_path is None or not self.energy_buffer:
+            return
+        self.energy_file.write(np.array(self.energy_buffer, dtype=np.int64).tobytes())
+        self.energy_file.flush()
+        self.energy_buffer = []
+
+    def _rewind(self):
+        """return to the last checkpoint (or the start) after an interrupted step"""
+        if os.path.exists(self.checkpoint_path):
+            self.load_checkpoint()
+        else:
+            self.step = 0
+            self.system.position = self.start_position.copy()
+            self.system.velocity = self.start_velocity.copy()
+            self.axis_periods[:] = 0
+        if self.energy_path is not None:
+            self.energy_file.close()
+            self._open_energy_series()
+
+    def run(self, max_steps=None):
+        """step until every axis has repeated, or until step max_steps.
+
+        returns the period of the whole system, or None if max_steps was
+        reached first.
+        """
+        try:
+            while (self.axis_periods == 0).any():
+                if max_steps is not None and self.step >= max_steps:
+                    self.save_checkpoint()
+                    return None
+                self.system.timestep()
+                self.step += 1
+                repeated = ((self.system.position == self.start_position)
+                            & (self.system.velocity == self.start_velocity)).all(axis=0)
+                new = repeated & (self.axis_periods == 0)
+                if new.any():
+                    self.axis_periods[new] = self.step
+                if self.energy_path is not None and self.step % self.energy_stride == 0:
+                    self.energy_buffer.append(self.system.total_energy())
+                    if len(self.energy_buffer) >= 4096:
+                        self._flush_energy_series()
+                if self.step % self.checkpoint_every == 0:
+                    self.save_checkpoint()
+        except BaseException:
+            # the state may be part way through a step, so it must not be saved
+            self._rewind()
+            raise
+        self.save_checkpoint()
+        return reduce(lcm, self.axis_periods.tolist())
+
+    def close(self):
+        if self.energy_path is not None:
+            self._flush_energy_series()
+            self.energy_file.close()
+
+def read_energy_series(energy_path):
+    """memory-map an energy series written by a SimulationRunner"""
+    return np.memmap(energy_path, dtype=np.int64, mode="r")
+
+class MoonTrajectory(object):
+    """answer queries about a MoonSystem's state at any step count.
+
+    The first query finds each axis's cycle and records that axis's
+    trajectory up to the end of its first cycle, stored in the smallest
+    integer type that fits. Reversible axes are recorded in the same pass
+    that finds their period; otherwise the cycle is found with find_cycle
+    and then replayed. Any later step t is then looked up on
+    each axis at t (before the cycle starts) or at the equivalent step within
+    the cycle, with no further simulation.
+    """
+
+    def __init__(self, system, reversible=True):
+        self.system = system.copy()
+        self.reversible = reversible
+        self.axes = None
+
+    def _record_axes(self):
+        self.axes = []
+        for n in range(self.system.position.shape[1]):
+            axis = self.system.axis(n)
+            if self.reversible:
+                period, start, positions, velocities = self._record_reversible_axis(axis)
+            else:
+                period, start = find_cycle(axis, self.reversible)
+                positions, velocities = self._replay_axis(axis, start + period)
+            self.axes.append((period, start, self._compact(positions),
+                              self._compact(velocities)))
+
+    def _record_reversible_axis(self, axis):
+        """record an axis while stepping it back round to its starting state"""
+        positions = [axis.position[:, 0].copy()]
+        velocities = [axis.velocity[:, 0].copy()]
+        current = axis.copy()
+        current.timestep()
+        while not current.same_state(axis):
+            positions.append(current.position[:, 0].copy())
+            velocities.append(current.velocity[:, 0].copy())
+            current.timestep()
+        return len(positions), 0, np.array(positions), np.array(velocities)
+
+    def _replay_axis(self, axis, steps):
+        """record the first steps states of an axis, once its cycle is known"""
+        positions = np.empty((steps, len(axis.position)), dtype=np.int64)
+        velocities = np.empty_like(positions)
+        for step in range(steps):
+            positions[step] = axis.position[:, 0]
+            velocities[step] = axis.velocity[:, 0]
+            axis.timestep()
+        return positions, velocities
+
+    def _compact(self, values):
+        # smallest signed type holding both -bound - 1 and bound
+        bound = max(-int(values.min()), int(values.max()), 0)
+        return values.astype(np.min_scalar_type(-bound - 1))
+
+    def period(self):
+        """number of steps until the whole system repeats"""
+        if self.axes is None:
+            self._record_axes()
+        return reduce(lcm, [period for period, _, _, _ in self.axes])
+
+    def state_at(self, t):
+        """return (positions, velocities) as (N, D) arrays after t steps"""
+        if t < 0:
+            raise Exception("cannot look up step {}; t must not be negative".format(t))
+        if self.axes is None:
+            self._record_axes()
+        positions = np.empty_like(self.system.position)
+        velocities = np.empty_like(self.system.velocity)
+        for n, (period, start, axis_positions, axis_velocities) in enumerate(self.axes):
+            if t >= start:
+                step = start + (t - start) % period
+            else:
+                step = t
+            positions[:, n] = axis_positions[step]
+            velocities[:, n] = axis_velocities[step]
+        return positions, velocities
+
+    def total_energy_at(self, t):
+        positions, velocities = self.state_at(t)
+        return MoonSystem(positions, velocities).total_energy()
+
+def _find_axis_cycle(args):
+    """pool worker: find_cycle for one single-axis system"""
+    system, reversible = args
+    return find_cycle(system, reversible)
+
+def find_repeated_state(moonlist, reversible=True, parallel=False):
+    """find the number of steps until the moons' state first repeats.
+
+    Every axis is simulated independently from the moons' current state and
+    the per-axis periods are combined with lcm. With parallel=True, each
+    axis is searched in its own worker process.
+    """
     print("searching for repeating states...")
+    system = MoonSystem([moon.position for moon in moonlist],
+                        [moon.velocity for moon in moonlist])
+    tasks = [(system.axis(n), reversible) for n in range(system.position.shape[1])]
+    if parallel:
+        pool = Pool(len(tasks))
+        try:
+            cycles = pool.map(_find_axis_cycle, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        cycles = [_find_axis_cycle(task) for task in tasks]
     repeats = []
     # solve each dimension (x,y,z) independently, then find LCM
-    for n in range(3):
-        step = 0
-        states = {}
-        while not save_state(moonlist, states, n, step):
-            timestep(moonlist)
-            step += 1
-        print("found repeating state for dimension: {} at step: {}".format(n, step))
-        repeats.append(step)
+    for n, (period, start) in enumerate(cycles):
+        if start:
+            print("found repeating state for dimension: {} at step: {} (cycle starts at step {})"
+                  .format(n, start + period, start))
+        else:
+            print("found repeating state for dimension: {} at step: {}".format(n, period))
+        repeats.append(period)
     print("period: {}".format(reduce(lcm, repeats)))
+    return reduce(lcm, repeats)
 
 def test():
     intext = "<x=-1, y=0, z=2>\n\
@@ -125,6 +586,114 @@ def test():
     energy = total_energy(moonlist)
     print(energy)
 
+    trajectory = MoonTrajectory(MoonSystem(parse_input_into_positions(intext)))
+    if (trajectory.total_energy_at(10) != energy
+            or trajectory.period() != 2772
+            or trajectory.total_energy_at(10 + 2772 * 10**9) != energy):
+        raise Exception("trajectory test failed")
+    try:
+        trajectory.state_at(-1)
+    except Exception:
+        pass
+    else:
+        raise Exception("trajectory test failed: negative step accepted")
+
+    start = parse_input_into_positions(intext)
+    batch = BatchMoonSystem([start, start + 5, start[::-1]])
+    batch.timestep(10)
+    if batch.total_energy()[2] != energy:
+        raise Exception("batch energy test failed")
+    # moons that all start together never move, so repeat after one step
+    batch = BatchMoonSystem([start, start + 5, start[::-1], np.zeros_like(start)])
+    if (batch.find_periods()[0] != [2772, 2772, 2772, 1]
+            or batch.steps.tolist() != [44, 44, 44, 1]):
+        raise Exception("batch period test failed")
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        checkpoint = os.path.join(tmpdir, "checkpoint.npz")
+        energies = os.path.join(tmpdir, "energy.bin")
+        system = MoonSystem(start)
+        runner = SimulationRunner(system, checkpoint, checkpoint_every=8,
+                                  energy_path=energies, energy_stride=5)
+        # stop part of the way in (the last axis repeats at step 44), then
+        # resume with a new runner
+        if runner.run(max_steps=30) is not None:
+            raise Exception("checkpoint test failed: finished early")
+        runner.close()
+        runner = SimulationRunner(system, checkpoint, checkpoint_every=8,
+                                  energy_path=energies, energy_stride=5)
+        period = runner.run()
+        runner.close()
+        series = read_energy_series(energies)
+        if period != 2772 or len(series) != 44 // 5 + 1 or series[2] != energy:
+            raise Exception("checkpoint test failed")
+
+        # interrupt a step between gravity and velocity updates; the runner
+        # must rewind to its last checkpoint rather than save the half step
+        os.remove(checkpoint)
+        runner = SimulationRunner(system, checkpoint, checkpoint_every=8,
+                                  energy_path=energies, energy_stride=5)
+        runner.run(max_steps=16)
+        def interrupted_velocity():
+            raise KeyboardInterrupt()
+        runner.system.apply_velocity = interrupted_velocity
+        try:
+            runner.run(max_steps=30)
+        except KeyboardInterrupt:
+            pass
+        del runner.system.apply_velocity
+        if runner.step != 16 or runner.run() != 2772:
+            raise Exception("interrupted checkpoint test failed")
+        runner.close()
+
+        # a checkpoint for one system must not be resumed by another
+        other_checkpoint = os.path.join(tmpdir, "other.npz")
+        runner = SimulationRunner(system, other_checkpoint, checkpoint_every=10)
+        runner.run(max_steps=20)
+        other = MoonSystem(parse_input_into_positions("<x=-8, y=-10, z=0>\n\
+<x=5, y=5, z=10>\n\
+<x=2, y=-7, z=3>\n\
+<x=9, y=-8, z=-3>"))
+        for mismatched in [other, MoonSystem(start, gravity="sorted")]:
+            try:
+                SimulationRunner(mismatched, other_checkpoint)
+            except Exception as e:
+                if "different moon system" not in str(e):
+                    raise
+            else:
+                raise Exception("mismatched checkpoint test failed")
+
+        # nor can an energy series be resumed at a different stride
+        try:
+            SimulationRunner(system, checkpoint, energy_path=energies, energy_stride=7)
+        except Exception as e:
+            if "energy stride" not in str(e):
+                raise
+        else:
+            raise Exception("mismatched energy stride test failed")
+        if len(read_energy_series(energies)) != 44 // 5 + 1:
+            raise Exception("mismatched energy stride test failed: series truncated")
+
+        # an energy series shorter than the checkpoint it goes with is an error
+        with open(energies, "r+b") as outfile:
+            outfile.truncate(8)
+        try:
+            SimulationRunner(system, checkpoint, energy_path=energies, energy_stride=5)
+        except Exception as e:
+            if "energy series" not in str(e):
+                raise
+        else:
+            raise Exception("short energy series test failed")
+    finally:
+        shutil.rmtree(tmpdir)
+
+    for gravity in ["pairwise", "sorted"]:
+        system = MoonSystem(parse_input_into_positions(intext), gravity=gravity)
+        system.timestep(10)
+        if system.total_energy() != energy:
+            raise Exception("{} gravity timestep test failed".format(gravity))
+
     find_repeated_state(moonlist)
 
 
@@ -133,14 +702,13 @@ if __name__ == "__main__":
     with open("input.txt", "r") as infile:
         inlines = infile.read()
     # part 1
-    moons = parse_input_into_moons(inlines)
-    for n in range(1000):
-        timestep(moons)
-    print("total energy: {}".format(total_energy(moons)))
+    system = MoonSystem(parse_input_into_positions(inlines))
+    system.timestep(1000)
+    print("total energy: {}".format(total_energy(system.moons())))
 
     # part 2
     moons = parse_input_into_moons(inlines)
-    find_repeated_state(moons)
+    find_repeated_state(moons, parallel=True)
 
 
 
@@ -5,13 +5,21 @@ from collections import defaultdict
 from copy import copy
 import sys
 
+import numpy as np
+
 
 class IntcodeComputer(object):
-    def __init__(self, raw_intcode_list, initial_inputs=[]):
+    def __init__(self, raw_intcode_list, initial_inputs=[],
+                 input_provider=None, output_consumer=None):
         self.pc = 0 # program counter
         self.rb = 0 # relative base
         self.input_queue = initial_inputs
         self.output_queue = []
+        # optional callables used instead of the queues: input_provider() is
+        # called for each input once the input queue is empty (returning None
+        # pauses the program), and output_consumer(value) receives each output
+        self.input_provider = input_provider
+        self.output_consumer = output_consumer
         self.intcodes = self.intcodes_from_list(raw_intcode_list)
 
     def intcodes_from_list(self, intcode_list):
@@ -42,7 +50,7 @@ class IntcodeComputer(object):
         self.output_queue = []
         return outlist
 
-    def run_program(self):
+    def run_program(self, max_outputs=None, stop=None):
         """run intcodes, which are stored as a dict of step: intcode pairs
 
         intcodes encode the operation as well as the parameter mode. The two least
@@ -51,6 +59,10 @@ class IntcodeComputer(object):
         is 1st parameter, thousands place is 2nd parameter, etc.)
         parameter mode 0: parameters is a position (an address)
         parameter mode 1: parameter is immediate (a literal value)
+
+        The program pauses (returning the intcodes and the program counter to
+        resume from) when it needs an input that is not available, after
+        max_outputs outputs, or when stop(output) returns True for an output.
         """
 
         num_params = {
@@ -103,6 +115,7 @@ class IntcodeComputer(object):
             return parameters
 
         last = len(self.intcodes) - 1
+        outputs = 0
 
         while self.pc <= last:
             op, param_modes = decode_intcode(self.intcodes[self.pc])
@@ -122,17 +135,31 @@ class IntcodeComputer(object):
                 # store input at address of parameter
                 check_remaining_opcodes()
                 args = get_parameters()
+                if self.input_queue:
+                    value = self.input_queue.pop(0)
+                elif self.input_provider is not None:
+                    value = self.input_provider()
+                else:
+                    value = None
                 # if no input is available, return
-                if len(self.input_queue) == 0:
+                if value is None:
                     return self.intcodes, self.pc
-                self.intcodes[args[0]] = int(self.input_queue.pop(0))
+                self.intcodes[args[0]] = int(value)
                 self.pc += num_params[op] + 1
             elif op == 4:
                 # print value at address of parameter
                 check_remaining_opcodes()
                 args = get_parameters()
-                self.output_queue.append(self.intcodes[args[0]])
+                value = self.intcodes[args[0]]
+                if self.output_consumer is not None:
+                    self.output_consumer(value)
+                else:
+                    self.output_queue.append(value)
                 self.pc += num_params[op] + 1
+                outputs += 1
+                if ((max_outputs is not None and outputs >= max_outputs)
+                        or (stop is not None and stop(value))):
+                    return self.intcodes, self.pc
             elif op == 5:
                 # jump if true (jump address in 2nd parameter)
                 check_remaining_opcodes()
@@ -199,10 +226,263 @@ def read_input(filename):
 
     return raw_intcodes
 
+class Grid(object):
+    """2D grid of values indexed by (x, y) tuples.
+
+    The grid starts out as a sparse dict. If a numpy dtype is given, it
+    switches to a numpy array (offset so that it can hold negative
+    coordinates) once the fraction of set cells in its bounding box reaches
+    density, after which counting, searching and rendering are vectorized.
+    If a write outside the array would grow the bounding box past that
+    density, the grid goes back to a sparse dict instead of reallocating.
+    The bounding box of the set cells is updated as cells are set, so it never
+    has to be found by scanning every key.
+
+    Reading a cell that has not been set returns default without inserting it
+    (unlike a defaultdict). If default is None, a KeyError is raised instead.
+    """
+
+    def __init__(self, default=None, dtype=None, density=0.5,
+                 min_dense_cells=64):
+        self.default = default
+        self.dtype = dtype
+        self.density = density
+        self.min_dense_cells = min_dense_cells
+        self.cells = {}     # sparse storage
+        self.array = None   # dense storage
+        self.mask = None    # which elements of the dense array are set
+        self.origin = None  # (x, y) location of dense array element [0, 0]
+        self.bounds = None  # (xmin, xmax, ymin, ymax) of the set cells
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, loc):
+        if self.array is None:
+            return loc in self.cells
+        index = self._array_index(loc)
+        return index is not None and bool(self.mask[index])
+
+    def __getitem__(self, loc):
+        if self.array is None:
+            if loc in self.cells:
+                return self.cells[loc]
+        else:
+            index = self._array_index(loc)
+            if index is not None and self.mask[index]:
+                return self.array[index].item()
+        if self.default is None:
+            raise KeyError(loc)
+        return self.default
+
+    def __setitem__(self, loc, value):
+        x, y = loc
+        if self.bounds is None:
+            self.bounds = (x, x, y, y)
+        else:
+            xmin, xmax, ymin, ymax = self.bounds
+            self.bounds = (min(x, xmin), max(x, xmax), min(y, ymin), max(y, ymax))
+
+        if self.array is None:
+            if loc not in self.cells:
+                self.size += 1
+            self.cells[loc] = value
+            self._maybe_densify()
+        else:
+            index = self._array_index(loc)
+            if index is None:
+                if not self._dense_enough(self.size + 1):
+                    # an outlier; a dense array covering it would be mostly empty
+                    self._sparsify()
+                    self.size += 1
+                    self.cells[loc] = value
+                    return
+                self._allocate()
+                index = self._array_index(loc)
+            if not self.mask[index]:
+                self.size += 1
+                self.mask[index] = True
+            self.array[index] = value
+
+    def _array_index(self, loc):
+        """convert a location to a dense array index, or None if outside"""
+        row = loc[1] - self.origin[1]
+        col = loc[0] - self.origin[0]
+        if 0 <= row < self.array.shape[0] and 0 <= col < self.array.shape[1]:
+            return row, col
+        return None
+
+    def _allocate(self):
+        """(re)allocate the dense arrays around the bounding box.
+
+        The arrays are padded by half the bounding box in each direction so
+        that a growing grid is only reallocated a logarithmic number of times.
+        """
+        xmin, xmax, ymin, ymax = self.bounds
+        h = ymax - ymin + 1
+        w = xmax - xmin + 1
+        origin = (xmin - (w // 2 + 1), ymin - (h // 2 + 1))
+        array = np.zeros((h + 2 * (h // 2 + 1), w + 2 * (w // 2 + 1)),
+                         dtype=self.dtype)
+        mask = np.zeros(array.shape, dtype=bool)
+        if self.array is not None:
+            row = self.origin[1] - origin[1]
+            col = self.origin[0] - origin[0]
+            rows, cols = self.array.shape
+            array[row:row + rows, col:col + cols] = self.array
+            mask[row:row + rows, col:col + cols] = self.mask
+        self.array = array
+        self.mask = mask
+        self.origin = origin
+
+    def _dense_enough(self, size):
+        """whether size set cells fill enough of the bounding box for an array"""
+        if size < self.min_dense_cells:
+            return False
+        xmin, xmax, ymin, ymax = self.bounds
+        return size >= self.density * (xmax - xmin + 1) * (ymax - ymin + 1)
+
+    def _maybe_densify(self):
+        """switch from sparse to dense storage once the grid is dense enough"""
+        if self.dtype is None or not self._dense_enough(self.size):
+            return
+        self._allocate()
+        for (x, y), value in self.cells.items():
+            index = (y - self.origin[1], x - self.origin[0])
+            self.array[index] = value
+            self.mask[index] = True
+        self.cells = {}
+
+    def _sparsify(self):
+        """switch from dense back to sparse storage"""
+        self.cells = dict(self.items())
+        self.array = None
+        self.mask = None
+        self.origin = None
+
+    def keys(self):
+        if self.array is None:
+            return list(self.cells)
+        rows, cols = np.nonzero(self.mask)
+        return [(int(c) + self.origin[0], int(r) + self.origin[1])
+                for r, c in zip(rows, cols)]
+
+    def values(self):
+        if self.array is None:
+            return list(self.cells.values())
+        return self.array[self.mask].tolist()
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def extents(self):
+        """return (xmin, xmax, ymin, ymax) of the set cells, or None if empty"""
+        return self.bounds
+
+    def window(self, bounds=None):
+        """return arrays of values and set-cell flags covering bounds.
+
+        bounds is an inclusive (xmin, xmax, ymin, ymax) tuple and defaults to
+        the extents of the grid (empty arrays if the grid is empty). Both
+        arrays are indexed as [y - ymin, x - xmin].
+        """
+        if bounds is None:
+            bounds = self.bounds
+        if bounds is None:
+            return (np.zeros((0, 0), dtype=self.dtype if self.dtype else object),
+                    np.zeros((0, 0), dtype=bool))
+        xmin, xmax, ymin, ymax = bounds
+        shape = (ymax - ymin + 1, xmax - xmin + 1)
+        values = np.zeros(shape, dtype=self.dtype if self.dtype else object)
+        mask = np.zeros(shape, dtype=bool)
+        if self.array is None:
+            for (x, y), value in self.cells.items():
+                if xmin <= x <= xmax and ymin <= y <= ymax:
+                    values[y - ymin, x - xmin] = value
+                    mask[y - ymin, x - xmin] = True
+        else:
+            # copy the overlap between bounds and the dense array
+            rows, cols = self.array.shape
+            r0 = max(ymin - self.origin[1], 0)
+            r1 = min(ymax - self.origin[1] + 1, rows)
+            c0 = max(xmin - self.origin[0], 0)
+            c1 = min(xmax - self.origin[0] + 1, cols)
+            if r0 < r1 and c0 < c1:
+                dest = (slice(r0 + self.origin[1] - ymin, r1 + self.origin[1] - ymin),
+                        slice(c0 + self.origin[0] - xmin, c1 + self.origin[0] - xmin))
+                values[dest] = self.array[r0:r1, c0:c1]
+                mask[dest] = self.mask[r0:r1, c0:c1]
+        return values, mask
+
+    def count(self, value):
+        """count set cells holding value"""
+        if self.array is None:
+            return sum(1 for v in self.cells.values() if v == value)
+        return int(np.count_nonzero((self.array == value) & self.mask))
+
+    def find(self, value):
+        """return the locations of all set cells holding value"""
+        if self.array is None:
+            return [loc for loc, v in self.cells.items() if v == value]
+        rows, cols = np.nonzero((self.array == value) & self.mask)
+        return [(int(c) + self.origin[0], int(r) + self.origin[1])
+                for r, c in zip(rows, cols)]
+
+    def neighbors(self, loc):
+        """return (location, value) pairs for the set cells next to loc"""
+        x, y = loc
+        return [(n, self[n]) for n in [(x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)]
+                if n in self]
+
+    def neighbor_counts(self, value, bounds=None):
+        """count, for every cell in bounds, the adjacent set cells holding value.
+
+        returns an int array indexed like window(bounds).
+        """
+        values, mask = self.window(bounds)
+        match = (mask & (values == value)).astype(np.int64)
+        counts = np.zeros_like(match)
+        counts[1:, :] += match[:-1, :]
+        counts[:-1, :] += match[1:, :]
+        counts[:, 1:] += match[:, :-1]
+        counts[:, :-1] += match[:, 1:]
+        return counts
+
+    def render(self, lookup, blank=" ", marks=None, bounds=None):
+        """render the grid as a list of strings, one per row.
+
+        lookup is either a dict of value: character pairs or a function from
+        value to character. Unset cells (and values missing from a lookup
+        dict) are drawn as blank. marks is an optional dict of location:
+        character pairs drawn on top. An empty grid renders as no rows.
+        """
+        if bounds is None:
+            bounds = self.bounds
+        if bounds is None:
+            return []
+        xmin, xmax, ymin, ymax = bounds
+        values, mask = self.window(bounds)
+        chars = np.full(values.shape, blank, dtype="<U1")
+        if callable(lookup):
+            for row, col in zip(*np.nonzero(mask)):
+                chars[row, col] = lookup(values[row, col])
+        else:
+            for value, char in lookup.items():
+                chars[mask & (values == value)] = char
+        for (x, y), char in (marks or {}).items():
+            if xmin <= x <= xmax and ymin <= y <= ymax:
+                chars[y - ymin, x - xmin] = char
+        return ["".join(row) for row in chars]
+
 class ArcadeCabinet(object):
     def __init__(self, game_program, patch_quarters=False):
         self.computer = IntcodeComputer(game_program)
-        self.sb = defaultdict(int)
+        self.sb = Grid(default=0, dtype=np.int64)
+        self.pending_outputs = []
         if patch_quarters:
             # cheat the elves out of their quarter
             print("initial quarter value: {}".format(self.computer.intcodes[0]))
@@ -211,33 +491,48 @@ class ArcadeCabinet(object):
     def run_game(self):
         print("starting new game. move paddle with j, k, l keys.")
 
-        # joystick values: 0 = neutral, -1 = left, 1 = right
-        while True:
-            # keep paddle directly under ball
-            # get ball location and paddle location
-            paddle_col = 0
-            ball_col = 0
-            for key, value in self.sb.items():
-                if value == 3:
-                    paddle_col = key[0]
-                elif value == 4:
-                    ball_col = key[0]
-
-            if ball_col == paddle_col:
-                inval = 0
-            elif ball_col > paddle_col:
-                inval = 1
-            else:
-                inval = -1
-            self.computer.add_to_input_queue([inval])
+        # the computer reads the joystick and draws tiles through callbacks,
+        # so the whole game is a single run
+        self.computer.input_provider = self.joystick
+        self.computer.output_consumer = self.handle_output
+        self.computer.run_program()
+        # game is over
+        self.draw_screen()
+        self.get_score()
 
-            intcodes, pc = self.computer.run_program()
-            self.build_screenbuffer()
-            self.draw_screen()
-            if pc == None:
-                # game is over
-                self.get_score()
-                break
+    def joystick(self):
+        """input provider: show the screen, then move the paddle.
+
+        joystick values: 0 = neutral, -1 = left, 1 = right
+        """
+        self.draw_screen()
+
+        # keep paddle directly under ball
+        # get ball location and paddle location
+        # (the score is stored at x = -1, so skip that column)
+        paddle_col = 0
+        ball_col = 0
+        for x, _ in self.sb.find(3):
+            if x >= 0:
+                paddle_col = x
+        for x, _ in self.sb.find(4):
+            if x >= 0:
+                ball_col = x
+
+        if ball_col == paddle_col:
+            return 0
+        elif ball_col > paddle_col:
+            return 1
+        else:
+            return -1
+
+    def handle_output(self, value):
+        """output consumer: outputs come in (x, y, tile) triples"""
+        self.pending_outputs.append(value)
+        if len(self.pending_outputs) == 3:
+            x, y, tile = self.pending_outputs
+            self.pending_outputs = []
+            self.sb[(x, y)] = tile
 
     def build_screenbuffer(self):
         output = self.computer.get_outputs()
@@ -257,24 +552,24 @@ class ArcadeCabinet(object):
                 3: "_",
                 4: "o"
                 }
-        w = 36
-        h = 22
-        for y in range(h):
-            row = []
-            for x in range(h):
-                row.append(lookup[self.sb[(x, y)]])
-            print("".join(row))
+        extents = self.sb.extents()
+        if extents is None:
+            return
+        # draw everything except the score column
+        _, xmax, _, ymax = extents
+        for row in self.sb.render(lookup, bounds=(0, xmax, 0, ymax)):
+            print(row)
 
     def get_score(self):
         print("score: {}".format(self.sb[(-1, 0)]))
         return self.sb[(-1, 0)]
 
     def count_tile_types(self):
-        print("blanks: {}".format(self.sb.values().count(0)))
-        print("walls: {}".format(self.sb.values().count(1)))
-        print("blocks: {}".format(self.sb.values().count(2)))
-        print("horiz paddles: {}".format(self.sb.values().count(3)))
-        print("balls: {}".format(self.sb.values().count(4)))
+        print("blanks: {}".format(self.sb.count(0)))
+        print("walls: {}".format(self.sb.count(1)))
+        print("blocks: {}".format(self.sb.count(2)))
+        print("horiz paddles: {}".format(self.sb.count(3)))
+        print("balls: {}".format(self.sb.count(4)))
         self.get_score()
 
 def test():
@@ -284,6 +579,29 @@ def test():
     game.build_screenbuffer()
     game.count_tile_types()
 
+    # a 10x7 screen (walls around blocks, with a ball above the paddle) is
+    # dense enough for the screenbuffer to switch to array storage
+    game = ArcadeCabinet([])
+    for y in range(7):
+        for x in range(10):
+            if x in (0, 9) or y == 0:
+                tile = 1
+            elif y < 3:
+                tile = 2
+            else:
+                tile = 0
+            for value in (x, y, tile):
+                game.handle_output(value)
+    for value in (6, 5, 4, 2, 6, 3, -1, 0, 1234):
+        game.handle_output(value)
+    if (game.sb.array is None or len(game.sb) != 71
+            or game.sb.count(1) != 22 or game.sb.count(2) != 16
+            or game.sb.find(3) != [(2, 6)] or game.get_score() != 1234):
+        raise Exception("screenbuffer test failed")
+    # the paddle moves towards the ball
+    if game.joystick() != 1:
+        raise Exception("joystick test failed")
+
 if __name__ == "__main__":
     test()
 
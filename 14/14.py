@@ -1,9 +1,10 @@
 #! /usr/bin/env python
 
 from __future__ import division, print_function
+from array import array
 from collections import defaultdict
+import heapq
 from copy import copy
-from math import ceil
 
 class Reaction(object):
     def __init__(self, reaction_string):
@@ -25,55 +26,250 @@ def parse_reaction_list(reaction_list):
     return reactions
 
 
-def balanced(banked_chemicals):
-    """return true if all non-ore chemicals have non-negative amounts."""
-    def _enough(chemical):
-        return chemical == "ORE" or banked_chemicals[chemical] >= 0
-    return all(map(_enough, banked_chemicals))
+class ReactionPlan(object):
+    """reactions compiled into a topologically ordered evaluation plan.
 
-def react(reactions, chemicals, product, repeat):
-    """do reaction to make chemical.
-    reactants are taken from chemicals. products are added to chemicals.
+    Chemicals are numbered so that every chemical comes before all of the
+    chemicals it is made from (ORE is last). Going through them in that
+    order, a chemical's total demand is known by the time it is reached, so
+    a single pass works out how many times each reaction has to run.
+
+    The reaction graph is held in flat arrays, CSR style: the reactants of
+    chemical i are reactant_index[reactant_start[i]:reactant_start[i + 1]],
+    with the matching quantities in reactant_quantity. reactions is either a
+    dict from parse_reaction_list or an iterable of reaction strings, which
+    are parsed straight into the arrays without building Reaction objects.
     """
-    rxn = reactions[product]
-    for reactant in rxn.reactants:
-        chemicals[reactant] -= repeat * rxn.reactants[reactant]
-    chemicals[product] += repeat * rxn.product_quantity
+
+    def __init__(self, reactions):
+        # intern chemical names as integer ids while collecting the reactions
+        ids = {}
+        made_by = array("i")        # reaction number for each chemical id
+        product_quantity = array("q")
+        reactant_start = array("q", [0])
+        reactant_id = array("i")
+        reactant_quantity = array("q")
+
+        def intern(name):
+            if name not in ids:
+                ids[name] = len(ids)
+                made_by.append(-1)
+            return ids[name]
+
+        if isinstance(reactions, dict):
+            parsed = ((rxn.product_name, rxn.product_quantity, rxn.reactants.items())
+                      for rxn in reactions.values())
+        else:
+            parsed = (self._parse(line) for line in reactions)
+        intern("ORE")
+        for product, quantity, reactants in parsed:
+            made_by[intern(product)] = len(product_quantity)
+            product_quantity.append(quantity)
+            for reactant, reactant_amount in reactants:
+                reactant_id.append(intern(reactant))
+                reactant_quantity.append(reactant_amount)
+            reactant_start.append(len(reactant_id))
+
+        # order chemicals so that each comes before its reactants
+        n = len(ids)
+        consumers = array("i", [0]) * n
+        for i in reactant_id:
+            consumers[i] += 1
+        ready = [i for i in range(n) if consumers[i] == 0]
+        order = array("i")
+        while ready:
+            i = ready.pop()
+            order.append(i)
+            r = made_by[i]
+            if r < 0:
+                continue
+            for k in range(reactant_start[r], reactant_start[r + 1]):
+                consumers[reactant_id[k]] -= 1
+                if consumers[reactant_id[k]] == 0:
+                    ready.append(reactant_id[k])
+        if len(order) != n:
+            raise Exception("reactions contain a cycle")
+        rank = array("i", [0]) * n
+        for position, i in enumerate(order):
+            rank[i] = position
+
+        # renumber everything in topological order
+        names = [None] * n
+        for name, i in ids.items():
+            names[rank[i]] = name
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.ore = self.index["ORE"]
+        self.product_quantity = array("q", [0]) * n
+        self.reactant_start = array("q", [0])
+        self.reactant_index = array("i")
+        self.reactant_quantity = array("q")
+        for i in order:
+            r = made_by[i]
+            if r >= 0:
+                self.product_quantity[rank[i]] = product_quantity[r]
+                for k in range(reactant_start[r], reactant_start[r + 1]):
+                    self.reactant_index.append(rank[reactant_id[k]])
+                    self.reactant_quantity.append(reactant_quantity[k])
+            self.reactant_start.append(len(self.reactant_index))
+
+    @staticmethod
+    def _parse(reaction_string):
+        """split a reaction string into (product, quantity, reactants)"""
+        r = reaction_string.split("=>")
+        product = r[1].split()
+        reactants = []
+        for reactant in r[0].split(","):
+            split = reactant.split()
+            reactants.append((split[1], int(split[0])))
+        return product[1], int(product[0]), reactants
+
+    def ore_for(self, product_name="FUEL", product_quantity=1):
+        """return the ore needed to make product_quantity of product_name"""
+        start = self.reactant_start
+        index = self.reactant_index
+        quantity = self.reactant_quantity
+        made = self.product_quantity
+        need = [0] * len(self.names)
+        need[self.index[product_name]] = product_quantity
+        for i in range(len(need)):
+            if need[i] > 0 and made[i]:
+                # run the reaction enough times to cover the demand
+                repeats = -(-need[i] // made[i])
+                for k in range(start[i], start[i + 1]):
+                    need[index[k]] += repeats * quantity[k]
+        return need[self.ore]
+
+class Nanofactory(object):
+    """a nanofactory that keeps its leftover chemicals between orders.
+
+    Every order is met from the stock first, and any surplus from the
+    reactions run to fill it stays in stock for later orders. An order only
+    visits the chemicals it actually needs: demands are processed from a
+    heap in plan order, so each chemical's demand is complete before its
+    reaction runs.
+    """
+
+    def __init__(self, reactions):
+        if isinstance(reactions, ReactionPlan):
+            self.plan = reactions
+        else:
+            self.plan = ReactionPlan(reactions)
+        self.inventory = [0] * len(self.plan.names)
+        self.ore_used = 0
+
+    def order(self, chemical, quantity):
+        """fill an order and return the ore it consumed"""
+        plan = self.plan
+        need = {plan.index[chemical]: quantity}
+        q = [plan.index[chemical]]
+        ore = 0
+        while q:
+            i = heapq.heappop(q)
+            amount = need.pop(i)
+            # use up stock first
+            used = min(self.inventory[i], amount)
+            self.inventory[i] -= used
+            amount -= used
+            if amount == 0:
+                continue
+            if i == plan.ore:
+                ore += amount
+                continue
+            repeats = -(-amount // plan.product_quantity[i])
+            self.inventory[i] += repeats * plan.product_quantity[i] - amount
+            for k in range(plan.reactant_start[i], plan.reactant_start[i + 1]):
+                reactant = plan.reactant_index[k]
+                if reactant not in need:
+                    need[reactant] = 0
+                    heapq.heappush(q, reactant)
+                need[reactant] += repeats * plan.reactant_quantity[k]
+        self.ore_used += ore
+        return ore
+
+    def order_batch(self, orders):
+        """fill a list of (chemical, quantity) orders in turn.
+
+        returns the ore consumed by each order.
+        """
+        return [self.order(chemical, quantity) for chemical, quantity in orders]
 
 def calculate_ore(reactions, product_name, product_quantity):
-    chemicals = {chemical: 0 for chemical in reactions}
-    chemicals["ORE"] = 0
-    chemicals[product_name] = -1 * product_quantity
-
-    while not balanced(chemicals):
-        # print(chemicals["FUEL"])
-        for chemical in chemicals:
-            if chemical != "ORE" and chemicals[chemical] < 0:
-                # do reactions multiple times
-                debt = -1 * chemicals[chemical]
-                product_per_rxn = reactions[chemical].product_quantity
-                repeats = int(ceil(debt / product_per_rxn))
-                # print("debt: {}, product_per_rxn: {}, repeats: {}".format(debt, product_per_rxn, repeats))
-                react(reactions, chemicals, chemical, repeats)
-    return -1 * chemicals["ORE"]
+    """ore needed for a product; reactions may be an already compiled ReactionPlan"""
+    if not isinstance(reactions, ReactionPlan):
+        reactions = ReactionPlan(reactions)
+    return reactions.ore_for(product_name, product_quantity)
+
+def max_fuel(plan, ore_budgets, product_name="FUEL"):
+    """find the most product that can be made with each of several ore budgets.
+
+    ore(fuel) is monotone and close to linear, so each answer is found by
+    secant steps between a fuel amount known to fit the budget and one known
+    not to, falling back to bisection when a step does not halve the
+    bracket. Budgets are answered in increasing order, so each answer is a
+    lower bound for the next, and evaluated amounts are shared between
+    budgets.
+
+    returns a list of (fuel, ore used) tuples in the order of ore_budgets.
+    """
+    cache = {0: 0}
+
+    def ore(fuel):
+        if fuel not in cache:
+            cache[fuel] = plan.ore_for(product_name, fuel)
+        return cache[fuel]
+
+    ore_per_fuel = ore(1)
+    answers = {}
+    lo = 0
+    for budget in sorted(set(ore_budgets)):
+        # making fuel in bulk never costs more than making it one at a time
+        lo = max(lo, budget // ore_per_fuel)
+        f_lo = ore(lo)
+
+        # extrapolate from the average cost so far until the budget is passed
+        hi = None
+        step = 1
+        while hi is None:
+            guess = lo + step
+            if f_lo:
+                guess = max(guess, lo * budget // f_lo)
+            f_guess = ore(guess)
+            if f_guess > budget:
+                hi, f_hi = guess, f_guess
+            else:
+                lo, f_lo = guess, f_guess
+                step *= 2
+
+        # shrink the bracket with secant steps
+        while hi - lo > 1:
+            width = hi - lo
+            guess = lo + (budget - f_lo) * (hi - lo) // (f_hi - f_lo)
+            guess = min(max(guess, lo + 1), hi - 1)
+            f_guess = ore(guess)
+            if f_guess > budget:
+                hi, f_hi = guess, f_guess
+            else:
+                lo, f_lo = guess, f_guess
+            if hi - lo > width // 2:
+                # poor step; bisect once to guarantee progress
+                guess = (lo + hi) // 2
+                if guess != lo:
+                    f_guess = ore(guess)
+                    if f_guess > budget:
+                        hi, f_hi = guess, f_guess
+                    else:
+                        lo, f_lo = guess, f_guess
+        answers[budget] = (lo, f_lo)
+    return [answers[budget] for budget in ore_budgets]
 
 def calculate_fuel_per_ore(rlist):
-    reactions = parse_reaction_list(rlist)
-    ore_goal = int(1e12)
-    ore_used = 0
-    low = 0
-    high = 100000000000
-    while low < high - 1:
-        mid = (high + low) // 2
-        ore_used = calculate_ore(reactions, "FUEL", mid)
-        if ore_used > ore_goal:
-            high = mid
-        else:
-            low = mid
-    if ore_used > ore_goal:
-        return mid - 1, calculate_ore(reactions, "FUEL", mid - 1)
+    """most fuel from a trillion ore; rlist may be an already compiled ReactionPlan"""
+    if isinstance(rlist, ReactionPlan):
+        plan = rlist
     else:
-        return mid, ore_used
+        plan = ReactionPlan(parse_reaction_list(rlist))
+    return max_fuel(plan, [int(1e12)])[0]
 
 def test():
     print("tests")
@@ -86,8 +282,9 @@ def test():
              "7 A, 1 E => 1 FUEL"
              ]
     reactions = parse_reaction_list(rlist)
+    plan = ReactionPlan(reactions)
     chemicals_needed = defaultdict(int)
-    print(calculate_ore(reactions, "FUEL", 1))
+    print(calculate_ore(plan, "FUEL", 1))
 
     # expected: 165 ORE
     rlist = ["9 ORE => 2 A",
@@ -99,8 +296,9 @@ def test():
              "2 AB, 3 BC, 4 CA => 1 FUEL"
              ]
     reactions = parse_reaction_list(rlist)
+    plan = ReactionPlan(reactions)
     chemicals_needed = defaultdict(int)
-    print(calculate_ore(reactions, "FUEL", 1))
+    print(calculate_ore(plan, "FUEL", 1))
 
     # expected: 13312 ORE
     rlist = ["157 ORE => 5 NZVS",
@@ -114,9 +312,10 @@ def test():
              "3 DCFZ, 7 NZVS, 5 HKGWZ, 10 PSHF => 8 KHKGT"
              ]
     reactions = parse_reaction_list(rlist)
+    plan = ReactionPlan(reactions)
     chemicals_needed = defaultdict(int)
-    print(calculate_ore(reactions, "FUEL", 1))
-    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(rlist)))
+    print(calculate_ore(plan, "FUEL", 1))
+    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(plan)))
 
     # expected: 180697 ORE
     rlist = ["2 VPVL, 7 FWMGM, 2 CXFTF, 11 MNCFX => 1 STKFG",
@@ -133,9 +332,10 @@ def test():
              "176 ORE => 6 VJHF"
              ]
     reactions = parse_reaction_list(rlist)
+    plan = ReactionPlan(reactions)
     chemicals_needed = defaultdict(int)
-    print(calculate_ore(reactions, "FUEL", 1))
-    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(rlist)))
+    print(calculate_ore(plan, "FUEL", 1))
+    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(plan)))
 
     # expected: 2210736 ORE
     rlist = ["171 ORE => 8 CNZTR",
@@ -157,9 +357,18 @@ def test():
              "5 BHXH, 4 VRPVC => 5 LTCX"
              ]
     reactions = parse_reaction_list(rlist)
+    plan = ReactionPlan(reactions)
     chemicals_needed = defaultdict(int)
-    print(calculate_ore(reactions, "FUEL", 1))
-    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(rlist)))
+    print(calculate_ore(plan, "FUEL", 1))
+    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(plan)))
+
+    # leftovers carry over between orders, so ten single orders cost the
+    # same as one order of ten
+    factory = Nanofactory(plan)
+    ore_per_order = factory.order_batch([("FUEL", 1)] * 10)
+    print("ore per order: {}".format(ore_per_order))
+    if sum(ore_per_order) != calculate_ore(plan, "FUEL", 10):
+        raise Exception("nanofactory test failed")
 
 if __name__ == "__main__":
     test()
@@ -169,10 +378,11 @@ if __name__ == "__main__":
         rlist = infile.read().splitlines()
 
     reactions = parse_reaction_list(rlist)
+    plan = ReactionPlan(reactions)
     chemicals_needed = defaultdict(int)
-    print(calculate_ore(reactions, "FUEL", 1))
+    print(calculate_ore(plan, "FUEL", 1))
 
     # part 2
     print("\npart 2")
-    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(rlist)))
+    print("fuel generated: {}; ore used: {}".format(*calculate_fuel_per_ore(plan)))
 
@@ -1,16 +1,32 @@
 #! /usr/bin/env python
 
 from __future__ import division, print_function
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from copy import copy, deepcopy
+import argparse
+import hashlib
+import heapq
+import multiprocessing
+import os
+import pickle
 import random
+import shutil
+import tempfile
+
+import numpy as np
 
 class IntcodeComputer(object):
-    def __init__(self, raw_intcode_list, initial_inputs=[]):
+    def __init__(self, raw_intcode_list, initial_inputs=[],
+                 input_provider=None, output_consumer=None):
         self.pc = 0 # program counter
         self.rb = 0 # relative base
         self.input_queue = initial_inputs
         self.output_queue = []
+        # optional callables used instead of the queues: input_provider() is
+        # called for each input once the input queue is empty (returning None
+        # pauses the program), and output_consumer(value) receives each output
+        self.input_provider = input_provider
+        self.output_consumer = output_consumer
         self.intcodes = self.intcodes_from_list(raw_intcode_list)
 
     def intcodes_from_list(self, intcode_list):
@@ -41,7 +57,7 @@ class IntcodeComputer(object):
         self.output_queue = []
         return outlist
 
-    def run_program(self):
+    def run_program(self, max_outputs=None, stop=None):
         """run intcodes, which are stored as a dict of step: intcode pairs
 
         intcodes encode the operation as well as the parameter mode. The two least
@@ -50,6 +66,10 @@ class IntcodeComputer(object):
         is 1st parameter, thousands place is 2nd parameter, etc.)
         parameter mode 0: parameters is a position (an address)
         parameter mode 1: parameter is immediate (a literal value)
+
+        The program pauses (returning the intcodes and the program counter to
+        resume from) when it needs an input that is not available, after
+        max_outputs outputs, or when stop(output) returns True for an output.
         """
 
         num_params = {
@@ -102,6 +122,7 @@ class IntcodeComputer(object):
             return parameters
 
         last = len(self.intcodes) - 1
+        outputs = 0
 
         while self.pc <= last:
             op, param_modes = decode_intcode(self.intcodes[self.pc])
@@ -121,17 +142,31 @@ class IntcodeComputer(object):
                 # store input at address of parameter
                 check_remaining_opcodes()
                 args = get_parameters()
+                if self.input_queue:
+                    value = self.input_queue.pop(0)
+                elif self.input_provider is not None:
+                    value = self.input_provider()
+                else:
+                    value = None
                 # if no input is available, return
-                if len(self.input_queue) == 0:
+                if value is None:
                     return self.intcodes, self.pc
-                self.intcodes[args[0]] = int(self.input_queue.pop(0))
+                self.intcodes[args[0]] = int(value)
                 self.pc += num_params[op] + 1
             elif op == 4:
                 # print value at address of parameter
                 check_remaining_opcodes()
                 args = get_parameters()
-                self.output_queue.append(self.intcodes[args[0]])
+                value = self.intcodes[args[0]]
+                if self.output_consumer is not None:
+                    self.output_consumer(value)
+                else:
+                    self.output_queue.append(value)
                 self.pc += num_params[op] + 1
+                outputs += 1
+                if ((max_outputs is not None and outputs >= max_outputs)
+                        or (stop is not None and stop(value))):
+                    return self.intcodes, self.pc
             elif op == 5:
                 # jump if true (jump address in 2nd parameter)
                 check_remaining_opcodes()
@@ -198,28 +233,264 @@ def read_input(filename):
 
     return raw_intcodes
 
+class Grid(object):
+    """2D grid of values indexed by (x, y) tuples.
+
+    The grid starts out as a sparse dict. If a numpy dtype is given, it
+    switches to a numpy array (offset so that it can hold negative
+    coordinates) once the fraction of set cells in its bounding box reaches
+    density, after which counting, searching and rendering are vectorized.
+    If a write outside the array would grow the bounding box past that
+    density, the grid goes back to a sparse dict instead of reallocating.
+    The bounding box of the set cells is updated as cells are set, so it never
+    has to be found by scanning every key.
+
+    Reading a cell that has not been set returns default without inserting it
+    (unlike a defaultdict). If default is None, a KeyError is raised instead.
+    """
+
+    def __init__(self, default=None, dtype=None, density=0.5,
+                 min_dense_cells=64):
+        self.default = default
+        self.dtype = dtype
+        self.density = density
+        self.min_dense_cells = min_dense_cells
+        self.cells = {}     # sparse storage
+        self.array = None   # dense storage
+        self.mask = None    # which elements of the dense array are set
+        self.origin = None  # (x, y) location of dense array element [0, 0]
+        self.bounds = None  # (xmin, xmax, ymin, ymax) of the set cells
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, loc):
+        if self.array is None:
+            return loc in self.cells
+        index = self._array_index(loc)
+        return index is not None and bool(self.mask[index])
+
+    def __getitem__(self, loc):
+        if self.array is None:
+            if loc in self.cells:
+                return self.cells[loc]
+        else:
+            index = self._array_index(loc)
+            if index is not None and self.mask[index]:
+                return self.array[index].item()
+        if self.default is None:
+            raise KeyError(loc)
+        return self.default
+
+    def __setitem__(self, loc, value):
+        x, y = loc
+        if self.bounds is None:
+            self.bounds = (x, x, y, y)
+        else:
+            xmin, xmax, ymin, ymax = self.bounds
+            self.bounds = (min(x, xmin), max(x, xmax), min(y, ymin), max(y, ymax))
+
+        if self.array is None:
+            if loc not in self.cells:
+                self.size += 1
+            self.cells[loc] = value
+            self._maybe_densify()
+        else:
+            index = self._array_index(loc)
+            if index is None:
+                if not self._dense_enough(self.size + 1):
+                    # an outlier; a dense array covering it would be mostly empty
+                    self._sparsify()
+                    self.size += 1
+                    self.cells[loc] = value
+                    return
+                self._allocate()
+                index = self._array_index(loc)
+            if not self.mask[index]:
+                self.size += 1
+                self.mask[index] = True
+            self.array[index] = value
+
+    def _array_index(self, loc):
+        """convert a location to a dense array index, or None if outside"""
+        row = loc[1] - self.origin[1]
+        col = loc[0] - self.origin[0]
+        if 0 <= row < self.array.shape[0] and 0 <= col < self.array.shape[1]:
+            return row, col
+        return None
+
+    def _allocate(self):
+        """(re)allocate the dense arrays around the bounding box.
+
+        The arrays are padded by half the bounding box in each direction so
+        that a growing grid is only reallocated a logarithmic number of times.
+        """
+        xmin, xmax, ymin, ymax = self.bounds
+        h = ymax - ymin + 1
+        w = xmax - xmin + 1
+        origin = (xmin - (w // 2 + 1), ymin - (h // 2 + 1))
+        array = np.zeros((h + 2 * (h // 2 + 1), w + 2 * (w // 2 + 1)),
+                         dtype=self.dtype)
+        mask = np.zeros(array.shape, dtype=bool)
+        if self.array is not None:
+            row = self.origin[1] - origin[1]
+            col = self.origin[0] - origin[0]
+            rows, cols = self.array.shape
+            array[row:row + rows, col:col + cols] = self.array
+            mask[row:row + rows, col:col + cols] = self.mask
+        self.array = array
+        self.mask = mask
+        self.origin = origin
+
+    def _dense_enough(self, size):
+        """whether size set cells fill enough of the bounding box for an array"""
+        if size < self.min_dense_cells:
+            return False
+        xmin, xmax, ymin, ymax = self.bounds
+        return size >= self.density * (xmax - xmin + 1) * (ymax - ymin + 1)
+
+    def _maybe_densify(self):
+        """switch from sparse to dense storage once the grid is dense enough"""
+        if self.dtype is None or not self._dense_enough(self.size):
+            return
+        self._allocate()
+        for (x, y), value in self.cells.items():
+            index = (y - self.origin[1], x - self.origin[0])
+            self.array[index] = value
+            self.mask[index] = True
+        self.cells = {}
+
+    def _sparsify(self):
+        """switch from dense back to sparse storage"""
+        self.cells = dict(self.items())
+        self.array = None
+        self.mask = None
+        self.origin = None
+
+    def keys(self):
+        if self.array is None:
+            return list(self.cells)
+        rows, cols = np.nonzero(self.mask)
+        return [(int(c) + self.origin[0], int(r) + self.origin[1])
+                for r, c in zip(rows, cols)]
+
+    def values(self):
+        if self.array is None:
+            return list(self.cells.values())
+        return self.array[self.mask].tolist()
+
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+
+    def extents(self):
+        """return (xmin, xmax, ymin, ymax) of the set cells, or None if empty"""
+        return self.bounds
+
+    def window(self, bounds=None):
+        """return arrays of values and set-cell flags covering bounds.
+
+        bounds is an inclusive (xmin, xmax, ymin, ymax) tuple and defaults to
+        the extents of the grid (empty arrays if the grid is empty). Both
+        arrays are indexed as [y - ymin, x - xmin].
+        """
+        if bounds is None:
+            bounds = self.bounds
+        if bounds is None:
+            return (np.zeros((0, 0), dtype=self.dtype if self.dtype else object),
+                    np.zeros((0, 0), dtype=bool))
+        xmin, xmax, ymin, ymax = bounds
+        shape = (ymax - ymin + 1, xmax - xmin + 1)
+        values = np.zeros(shape, dtype=self.dtype if self.dtype else object)
+        mask = np.zeros(shape, dtype=bool)
+        if self.array is None:
+            for (x, y), value in self.cells.items():
+                if xmin <= x <= xmax and ymin <= y <= ymax:
+                    values[y - ymin, x - xmin] = value
+                    mask[y - ymin, x - xmin] = True
+        else:
+            # copy the overlap between bounds and the dense array
+            rows, cols = self.array.shape
+            r0 = max(ymin - self.origin[1], 0)
+            r1 = min(ymax - self.origin[1] + 1, rows)
+            c0 = max(xmin - self.origin[0], 0)
+            c1 = min(xmax - self.origin[0] + 1, cols)
+            if r0 < r1 and c0 < c1:
+                dest = (slice(r0 + self.origin[1] - ymin, r1 + self.origin[1] - ymin),
+                        slice(c0 + self.origin[0] - xmin, c1 + self.origin[0] - xmin))
+                values[dest] = self.array[r0:r1, c0:c1]
+                mask[dest] = self.mask[r0:r1, c0:c1]
+        return values, mask
+
+    def count(self, value):
+        """count set cells holding value"""
+        if self.array is None:
+            return sum(1 for v in self.cells.values() if v == value)
+        return int(np.count_nonzero((self.array == value) & self.mask))
+
+    def find(self, value):
+        """return the locations of all set cells holding value"""
+        if self.array is None:
+            return [loc for loc, v in self.cells.items() if v == value]
+        rows, cols = np.nonzero((self.array == value) & self.mask)
+        return [(int(c) + self.origin[0], int(r) + self.origin[1])
+                for r, c in zip(rows, cols)]
+
+    def neighbors(self, loc):
+        """return (location, value) pairs for the set cells next to loc"""
+        x, y = loc
+        return [(n, self[n]) for n in [(x, y - 1), (x, y + 1), (x - 1, y), (x + 1, y)]
+                if n in self]
+
+    def neighbor_counts(self, value, bounds=None):
+        """count, for every cell in bounds, the adjacent set cells holding value.
+
+        returns an int array indexed like window(bounds).
+        """
+        values, mask = self.window(bounds)
+        match = (mask & (values == value)).astype(np.int64)
+        counts = np.zeros_like(match)
+        counts[1:, :] += match[:-1, :]
+        counts[:-1, :] += match[1:, :]
+        counts[:, 1:] += match[:, :-1]
+        counts[:, :-1] += match[:, 1:]
+        return counts
+
+    def render(self, lookup, blank=" ", marks=None, bounds=None):
+        """render the grid as a list of strings, one per row.
+
+        lookup is either a dict of value: character pairs or a function from
+        value to character. Unset cells (and values missing from a lookup
+        dict) are drawn as blank. marks is an optional dict of location:
+        character pairs drawn on top. An empty grid renders as no rows.
+        """
+        if bounds is None:
+            bounds = self.bounds
+        if bounds is None:
+            return []
+        xmin, xmax, ymin, ymax = bounds
+        values, mask = self.window(bounds)
+        chars = np.full(values.shape, blank, dtype="<U1")
+        if callable(lookup):
+            for row, col in zip(*np.nonzero(mask)):
+                chars[row, col] = lookup(values[row, col])
+        else:
+            for value, char in lookup.items():
+                chars[mask & (values == value)] = char
+        for (x, y), char in (marks or {}).items():
+            if xmin <= x <= xmax and ymin <= y <= ymax:
+                chars[y - ymin, x - xmin] = char
+        return ["".join(row) for row in chars]
+
 def print_map(m, bot_location=None):
-    # find extents of map
-    xmin = 0
-    xmax = 0
-    ymin = 0
-    ymax = 0
-    for x, y in m:
-        xmax = max(x, xmax)
-        xmin = min(x, xmin)
-        ymax = max(y, ymax)
-        ymin = min(y, ymin)
-    # plot map
-    for y in range(ymin, ymax + 1):
-        row = []
-        for x in range(xmin, xmax + 1):
-            if bot_location is not None and (x, y) == bot_location:
-                row.append("D")
-            elif (x, y) in m:
-                row.append(m[(x, y)][0])
-            else:
-                row.append(" ")
-        print("".join(row))
+    marks = {}
+    if bot_location is not None:
+        marks[bot_location] = "D"
+    for row in m.render(lambda cell: cell[0], marks=marks):
+        print(row)
 
 
 def next_location(current_location, direction):
@@ -231,27 +502,241 @@ def next_location(current_location, direction):
     return (current_location[0] + dir_step[direction][0],
             current_location[1] + dir_step[direction][1])
 
-def bfs(start_location=(0,0), goal=None):
+def report_oxygen(m, oxygen_location, start_location=(0,0)):
+    """count (and print) the steps from the start to the oxygen system.
+
+    The parent locations in the map only give a shortest path if the map was
+    explored breadth-first, so the count comes from a BFS over the map.
+    """
+    steps = 0
+    if oxygen_location is not None:
+        print("found oxygen system at {}! (2)".format(oxygen_location))
+        open_cells, (xmin, ymin) = map_to_grid(m)
+        times = flood_grid(open_cells, [(start_location[1] - ymin,
+                                         start_location[0] - xmin)])
+        steps = int(times[oxygen_location[1] - ymin, oxygen_location[0] - xmin])
+        print("reached oxygen system in {} steps".format(steps))
+    return steps
+
+def reverse_direction(direction):
+    """return the movement command that undoes a move in direction"""
+    return {1: 2, 2: 1, 3: 4, 4: 3}[direction]
+
+def move_droid(bot, direction):
+    """send a single movement command to a live droid and return its status"""
+    bot.add_to_input_queue([direction])
+    bot.run_program()
+    return bot.get_outputs().pop()
+
+def dfs(start_location=(0,0), bot=None):
+    """explore the entire map depth-first with a single live droid.
+
+    Instead of saving a copy of the computer state in every cell, the droid is
+    physically walked back along its path (with the reverse of each move) once
+    all directions from a cell have been tried. The map therefore only holds
+    the cell contents and parent locations. bot defaults to a new droid
+    running the program in input.txt.
+
+    returns the oxygen system location, the number of steps to reach it, and
+    the map.
+    """
+    if bot is None:
+        bot = IntcodeComputer(read_input("input.txt"), [])
+    pos = tuple(start_location)
+    oxygen_location = None
+    # m maps (x, y) tuples to (content, None, parent loc, 0) tuples, matching
+    # the layout used by bfs
+    m = Grid()
+    m[pos] = ("X", None, None, 0)
+    # each stack entry is a location, the directions still to try from it, and
+    # the move that took the droid there
+    stack = [(pos, [4, 3, 2, 1], None)]
+    while stack:
+        loc, directions, arrived_by = stack[-1]
+        if not directions:
+            # dead end; walk the droid back to the previous cell
+            stack.pop()
+            if arrived_by is not None:
+                move_droid(bot, reverse_direction(arrived_by))
+            continue
+        d = directions.pop()
+        next_loc = next_location(loc, d)
+        if next_loc in m:
+            continue
+        result = move_droid(bot, d)
+        if result == 0:
+            # wall; the droid did not move
+            m[next_loc] = ("#", None, loc, 0)
+        else:
+            if result == 1:
+                m[next_loc] = (".", None, loc, 0)
+            else:
+                m[next_loc] = ("o", None, loc, 0)
+                oxygen_location = next_loc
+            stack.append((next_loc, [4, 3, 2, 1], d))
+
+    steps = report_oxygen(m, oxygen_location, start_location)
+    return oxygen_location, steps, m
+
+def _probe_cell(task):
+    """try the given directions from one frontier cell.
+
+    task is a (location, directions, snapshot) tuple, where the snapshot is
+    the (intcodes, pc, rb) state of a droid standing in that cell. Each
+    direction is tried from a fresh copy of the snapshot.
+
+    returns the location and a list of (next location, status, snapshot)
+    tuples. The snapshot is None for walls.
+    """
+    loc, directions, (intcodes, pc, rb) = task
+    bot = IntcodeComputer([], [])
+    results = []
+    for d in directions:
+        bot.intcodes = defaultdict(int, intcodes)
+        bot.pc = pc
+        bot.rb = rb
+        result = move_droid(bot, d)
+        if result == 0:
+            results.append((next_location(loc, d), result, None))
+        else:
+            results.append((next_location(loc, d), result,
+                            (dict(bot.intcodes), bot.pc, bot.rb)))
+    return loc, results
+
+def parallel_bfs(start_location=(0,0), processes=None, m=None, frontier=None,
+                 max_levels=None, raw_intcodes=None):
+    """explore the map breadth-first, probing frontier cells in parallel.
+
+    Each level of the search sends the current frontier (cells with their
+    saved droid state) to a pool of worker processes. Probing different cells
+    is independent, so the workers' results are simply merged into the map
+    before the next level starts. Only frontier cells hold droid state.
+
+    An existing map and frontier (dict of location: snapshot) can be passed
+    in to continue a partial exploration, and max_levels limits how many
+    levels are explored. raw_intcodes is the droid program to start a new
+    exploration with, and defaults to the program in input.txt.
+
+    returns the oxygen system location, the number of steps to reach it, the
+    map, and the unexplored frontier (empty once the map is complete).
+    """
+    if m is None:
+        if raw_intcodes is None:
+            raw_intcodes = read_input("input.txt")
+        bot = IntcodeComputer(raw_intcodes, [])
+        pos = tuple(start_location)
+        m = Grid()
+        m[pos] = ("X", None, None, 0)
+        frontier = {pos: (dict(bot.intcodes), bot.pc, bot.rb)}
+    oxygen_location = None
+    for loc in m:
+        if m[loc][0] == "o":
+            oxygen_location = loc
+
+    pool = multiprocessing.Pool(processes)
+    level = 0
+    try:
+        while frontier and (max_levels is None or level < max_levels):
+            tasks = []
+            for loc, snapshot in frontier.items():
+                directions = [d for d in [1, 2, 3, 4]
+                              if next_location(loc, d) not in m]
+                if directions:
+                    tasks.append((loc, directions, snapshot))
+            chunksize = max(1, len(tasks) // (4 * (processes or
+                                              multiprocessing.cpu_count())))
+            next_frontier = {}
+            for loc, results in pool.imap(_probe_cell, tasks, chunksize):
+                for next_loc, result, snapshot in results:
+                    if next_loc in m:
+                        # already discovered from another frontier cell
+                        continue
+                    if result == 0:
+                        m[next_loc] = ("#", None, loc, 0)
+                    else:
+                        if result == 1:
+                            m[next_loc] = (".", None, loc, 0)
+                        else:
+                            m[next_loc] = ("o", None, loc, 0)
+                            oxygen_location = next_loc
+                        next_frontier[next_loc] = snapshot
+            frontier = next_frontier
+            level += 1
+    finally:
+        pool.close()
+        pool.join()
+
+    steps = report_oxygen(m, oxygen_location, start_location)
+    return oxygen_location, steps, m, frontier
+
+def program_hash(raw_intcodes):
+    """return a hex digest identifying a droid program"""
+    return hashlib.sha256(",".join(str(code) for code in raw_intcodes)
+                          .encode("ascii")).hexdigest()
+
+# version of the cache file layout, bumped whenever it changes
+MAP_CACHE_VERSION = 1
+
+def save_map_cache(cache_dir, raw_intcodes, m, oxygen_location, frontier=None):
+    """save an explored map to cache_dir, keyed by the program hash.
+
+    Only cell contents and parent locations are kept from the map. frontier
+    (as returned by parallel_bfs) holds droid checkpoints for cells that
+    still need exploring, so a partial map can be continued later.
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    path = os.path.join(cache_dir, program_hash(raw_intcodes) + ".pickle")
+    cells = dict((loc, (cell[0], cell[2])) for loc, cell in m.items())
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as outfile:
+        pickle.dump({"version": MAP_CACHE_VERSION,
+                     "cells": cells,
+                     "oxygen": oxygen_location,
+                     "frontier": frontier or {}},
+                    outfile, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_map_cache(cache_dir, raw_intcodes):
+    """load a map saved by save_map_cache.
+
+    returns the map, the oxygen system location, and the frontier
+    checkpoints (empty if the map is complete), or None if this program has
+    no cached map. A cache written in a different format raises an exception.
+    """
+    path = os.path.join(cache_dir, program_hash(raw_intcodes) + ".pickle")
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as infile:
+        cache = pickle.load(infile)
+    if not isinstance(cache, dict) or cache.get("version") != MAP_CACHE_VERSION:
+        raise Exception("map cache {} is not in version {} format; delete it to "
+                        "explore again".format(path, MAP_CACHE_VERSION))
+    m = Grid()
+    for loc, (content, parent) in cache["cells"].items():
+        m[loc] = (content, None, parent, 0)
+    return m, cache["oxygen"], cache["frontier"]
+
+def bfs(start_location=(0,0)):
+    """explore the entire map, restoring a saved droid state for each cell.
+
+    Every open cell keeps a copy of the computer state of a droid standing
+    in it, and each unexplored direction is tried from a copy of that state.
+    The whole map is explored before the oxygen system is reported, since
+    both the step count and the oxygen flood need the complete map.
+
+    returns the oxygen system location, the number of steps to reach it, and
+    the map.
+    """
     bot = IntcodeComputer(read_input("input.txt"))
     pos = tuple(start_location)
+    oxygen_location = None
     # m maps (x, y) tuples to (content, intcode computer state, parent loc) tuples
-    m = {pos: ("X", (bot.intcodes, bot.pc), None, 0)}
+    m = Grid()
+    m[pos] = ("X", (bot.intcodes, bot.pc), None, 0)
     q = [pos]
     while q:
         loc = q.pop()
-        if goal is not None and m[loc][0] == goal:
-            # found goal. tally steps backwards:
-            print("found oxygen system at {}! (2)".format(loc))
-            oxygen_location = loc
-            steps = 0
-            print_map(m, loc)
-            while m[loc][2] is not None:
-                loc = m[loc][2]
-                # m[loc] = ("x", m[loc][1], m[loc][2])
-                steps += 1
-            print("reached oxygen system in {} steps".format(steps))
-            # print_map(m, loc)
-            return oxygen_location, steps, m
         for d in [1, 2, 3, 4]:
             # try each direction
             next_loc = next_location(loc, d)
@@ -274,27 +759,468 @@ def bfs(start_location=(0,0), goal=None):
                 else:
                     # undiscovered, oxygen!
                     m[next_loc] = ("o", (intcodes, pc), loc, 0)
+                    oxygen_location = next_loc
                     q.append(next_loc)
 
-def flood(start_location, m):
-    pos = tuple(start_location)
-    q = [pos]
-    while q:
-        loc = q.pop()
-        for d in [1, 2, 3, 4]:
-            next_loc = next_location(loc, d)
-            if next_loc not in m:
-                m[next_loc] = ("0", None, loc, m[loc][3] + 1)
-                q.append(next_loc)
-            elif m[next_loc][0] not in ["O", "#"]:
-                m[next_loc] = ("O", m[next_loc][1], m[next_loc][2], m[loc][3] + 1)
-                q.append(next_loc)
+    steps = report_oxygen(m, oxygen_location, start_location)
+    return oxygen_location, steps, m
+
+def map_to_grid(m):
+    """convert an explored map into a dense boolean grid of open cells.
+
+    Walls and unexplored cells are both closed. returns the grid, indexed as
+    [y, x], and the (x, y) map location of grid element [0, 0].
+    """
+    xmin, xmax, ymin, ymax = m.extents()
+    open_cells = np.zeros((ymax - ymin + 1, xmax - xmin + 1), dtype=bool)
+    for (x, y), cell in m.items():
+        if cell[0] != "#":
+            open_cells[y - ymin, x - xmin] = True
+    return open_cells, (xmin, ymin)
+
+def flood_grid(open_cells, sources):
+    """flood a boolean grid from one or more source cells.
+
+    Each minute, the whole frontier is dilated by one cell in every direction
+    at once (shifted-array ORs), so the result is a breadth-first fill.
+
+    sources are (row, col) grid indices. returns an int array holding the
+    minute each cell fills at, or -1 for cells that never fill.
+    """
+    times = np.full(open_cells.shape, -1, dtype=np.int64)
+    frontier = np.zeros(open_cells.shape, dtype=bool)
+    for row, col in sources:
+        frontier[row, col] = True
+    filled = frontier.copy()
+    minute = 0
+    while frontier.any():
+        times[frontier] = minute
+        spread = np.zeros_like(frontier)
+        spread[1:, :] |= frontier[:-1, :]
+        spread[:-1, :] |= frontier[1:, :]
+        spread[:, 1:] |= frontier[:, :-1]
+        spread[:, :-1] |= frontier[:, 1:]
+        frontier = spread & open_cells & ~filled
+        filled |= frontier
+        minute += 1
+    return times
+
+def flood(start_locations, m):
+    """fill the map with oxygen from one or more (x, y) locations.
+
+    The map must be fully explored; an exception is raised if any open cell
+    still has an unexplored neighbor.
+
+    returns the array of fill times from flood_grid and the (x, y) map
+    location of its [0, 0] element.
+    """
+    if isinstance(start_locations[0], int):
+        start_locations = [start_locations]
+    # unexplored cells count as walls, so any missing cell next to an open
+    # one could hide part of the fill
+    for loc, cell in m.items():
+        if cell[0] != "#":
+            for d in [1, 2, 3, 4]:
+                if next_location(loc, d) not in m:
+                    raise Exception("cannot flood a partially explored map: "
+                                    "{} has an unexplored neighbor".format(loc))
+    open_cells, (xmin, ymin) = map_to_grid(m)
+    times = flood_grid(open_cells,
+                       [(y - ymin, x - xmin) for x, y in start_locations])
+    for row, col in zip(*np.nonzero(times >= 0)):
+        loc = (int(col) + xmin, int(row) + ymin)
+        m[loc] = ("O", m[loc][1], m[loc][2], int(times[row, col]))
 
     print_map(m)
-    print("oxygen flooding complete in {} minutes".format(m[loc][3]))
+    print("oxygen flooding complete in {} minutes".format(times.max()))
+    return times, (xmin, ymin)
+
+class MazeRouter(object):
+    """answer shortest-path queries between arbitrary cells of an explored map.
+
+    Distance fields (the BFS distance from one source to every cell) are
+    computed on demand and kept in a least-recently-used cache of cache_size
+    fields. A source only gets a field once it has been queried promote_after
+    times; until then its queries are answered with a one-off A* search.
+    """
+
+    def __init__(self, m, cache_size=16, promote_after=2):
+        self.open_cells, self.origin = map_to_grid(m)
+        self.cache_size = cache_size
+        self.promote_after = promote_after
+        self.fields = OrderedDict()
+        self.query_counts = defaultdict(int)
+
+    def _index(self, loc):
+        """convert an (x, y) map location into a (row, col) grid index"""
+        row = loc[1] - self.origin[1]
+        col = loc[0] - self.origin[0]
+        if not (0 <= row < self.open_cells.shape[0]
+                and 0 <= col < self.open_cells.shape[1]):
+            raise Exception("location {} is outside the map".format(loc))
+        return row, col
+
+    def _location(self, index):
+        """convert a (row, col) grid index into an (x, y) map location"""
+        return (int(index[1]) + self.origin[0], int(index[0]) + self.origin[1])
+
+    def _neighbors(self, index):
+        row, col = index
+        for r, c in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+            if (0 <= r < self.open_cells.shape[0]
+                    and 0 <= c < self.open_cells.shape[1]
+                    and self.open_cells[r, c]):
+                yield r, c
+
+    def distance_field(self, source):
+        """return the (cached) array of distances from source to every cell"""
+        if source in self.fields:
+            self.fields.move_to_end(source)
+            return self.fields[source]
+        field = flood_grid(self.open_cells, [self._index(source)])
+        self.fields[source] = field
+        if len(self.fields) > self.cache_size:
+            self.fields.popitem(last=False)
+        return field
+
+    def _field_for(self, a, b):
+        """find a distance field usable for a query between a and b.
+
+        The map is undirected, so a field from either end will do. returns
+        the field and the location it was computed from, or (None, None) if
+        neither end is warm enough to deserve a field yet.
+        """
+        for source in (a, b):
+            if source in self.fields:
+                self.fields.move_to_end(source)
+                return self.fields[source], source
+        self.query_counts[a] += 1
+        if self.query_counts[a] >= self.promote_after:
+            return self.distance_field(a), a
+        return None, None
+
+    def _astar(self, a, b):
+        """find a shortest path from a to b with A* (manhattan heuristic).
+
+        returns the list of grid indices from a to b, or None if b cannot be
+        reached.
+        """
+        start = self._index(a)
+        goal = self._index(b)
+        if not (self.open_cells[start] and self.open_cells[goal]):
+            return None
+
+        def h(index):
+            return abs(index[0] - goal[0]) + abs(index[1] - goal[1])
+
+        parents = {start: None}
+        costs = {start: 0}
+        q = [(h(start), 0, start)]
+        while q:
+            _, cost, index = heapq.heappop(q)
+            if index == goal:
+                path = []
+                while index is not None:
+                    path.append(index)
+                    index = parents[index]
+                return path[::-1]
+            if cost > costs[index]:
+                # stale queue entry
+                continue
+            for n in self._neighbors(index):
+                if n not in costs or cost + 1 < costs[n]:
+                    costs[n] = cost + 1
+                    parents[n] = index
+                    heapq.heappush(q, (cost + 1 + h(n), cost + 1, n))
+        return None
+
+    def _descend(self, field, start):
+        """follow a distance field downhill from start to its source"""
+        index = start
+        path = [index]
+        while field[index] > 0:
+            for n in self._neighbors(index):
+                if field[n] == field[index] - 1:
+                    index = n
+                    break
+            else:
+                raise Exception("no downhill step from {} in distance field"
+                                .format(self._location(index)))
+            path.append(index)
+        return path
+
+    def _is_open(self, loc):
+        return bool(self.open_cells[self._index(loc)])
+
+    def distance(self, a, b):
+        """return the number of steps from a to b, or None if unreachable"""
+        if not (self._is_open(a) and self._is_open(b)):
+            return None
+        field, source = self._field_for(a, b)
+        if field is None:
+            path = self._astar(a, b)
+            return None if path is None else len(path) - 1
+        other = b if source == a else a
+        steps = int(field[self._index(other)])
+        return None if steps < 0 else steps
+
+    def route(self, a, b):
+        """return the list of (x, y) locations from a to b, or None"""
+        if not (self._is_open(a) and self._is_open(b)):
+            return None
+        field, source = self._field_for(a, b)
+        if field is None:
+            path = self._astar(a, b)
+        elif source == a:
+            if field[self._index(b)] < 0:
+                return None
+            path = self._descend(field, self._index(b))[::-1]
+        else:
+            if field[self._index(a)] < 0:
+                return None
+            path = self._descend(field, self._index(a))
+        if path is None:
+            return None
+        return [self._location(index) for index in path]
+
+
+def test():
+    # test1: run_program pausing and callbacks, with a program that echoes
+    # every input back as an output
+    echo = [3, 7, 4, 7, 1105, 1, 0]
+    bot = IntcodeComputer(echo, [1, 2, 3, 4])
+    bot.run_program(max_outputs=2)
+    first = bot.get_outputs()
+    bot.run_program(stop=lambda value: value == 3)
+    second = bot.get_outputs()
+    _, pc = bot.run_program()
+    if first != [1, 2] or second != [3] or bot.get_outputs() != [4] or pc is None:
+        raise Exception("test1 failed")
+    inputs = iter([5, 6])
+    outputs = []
+    bot = IntcodeComputer(echo, [], input_provider=lambda: next(inputs, None),
+                          output_consumer=outputs.append)
+    _, pc = bot.run_program()
+    if outputs != [5, 6] or bot.get_outputs() or pc is None:
+        raise Exception("test1 failed: callbacks")
+
+    # test2: Grid lookups, and the switch from sparse to dense storage
+    grid = Grid(default=0, dtype=np.int64, min_dense_cells=4)
+    for loc in [(-1, -1), (0, -1), (-1, 0)]:
+        grid[loc] = 1
+    if grid.array is not None or grid[(5, 5)] != 0 or (5, 5) in grid:
+        raise Exception("test2 failed: sparse grid")
+    grid[(0, 0)] = 2
+    if grid.array is None or len(grid) != 4 or grid.count(1) != 3:
+        raise Exception("test2 failed: grid did not become dense")
+    grid[(2, 1)] = 2
+    if (grid.array is None or sorted(grid.find(2)) != [(0, 0), (2, 1)]
+            or grid[(-1, -1)] != 1 or grid.extents() != (-1, 2, -1, 1)
+            or (5, 5) in grid):
+        raise Exception("test2 failed: dense grid")
+    # a far away write would need a huge, nearly empty array
+    grid[(20000, 20000)] = 1
+    if (grid.array is not None or len(grid) != 6 or grid.count(1) != 4
+            or grid[(2, 1)] != 2 or grid.extents() != (-1, 20000, -1, 20000)):
+        raise Exception("test2 failed: outlier write")
+    if Grid().render({}) != [] or Grid().window()[1].shape != (0, 0):
+        raise Exception("test2 failed: empty grid")
+    try:
+        Grid()[(0, 0)]
+    except KeyError:
+        pass
+    else:
+        raise Exception("test2 failed: missing cell without default")
+
+    # a ring of open cells around a wall, with the oxygen system two steps
+    # east of the start and a separate open column that cannot be reached
+    maze = ["#########",
+            "#X.o..#.#",
+            "#.###.#.#",
+            "#.....#.#",
+            "#########"]
+
+    class MazeDroid(object):
+        """stand-in for the droid program, moving around maze"""
+        def __init__(self):
+            self.location = (1, 1)
+            self.inputs = []
+            self.outputs = []
+        def add_to_input_queue(self, inlist):
+            self.inputs += inlist
+        def run_program(self):
+            for direction in self.inputs:
+                x, y = next_location(self.location, direction)
+                if maze[y][x] == "#":
+                    self.outputs.append(0)
+                else:
+                    self.location = (x, y)
+                    self.outputs.append(2 if maze[y][x] == "o" else 1)
+            self.inputs = []
+        def get_outputs(self):
+            outputs = self.outputs
+            self.outputs = []
+            return outputs
+
+    # test3: exploring the maze by backtracking. the droid reaches the
+    # oxygen system the long way round, so its parent chain is 10 steps
+    oxygen_location, steps, m = dfs((1, 1), MazeDroid())
+    if oxygen_location != (3, 1) or steps != 2 or (7, 1) in m:
+        raise Exception("test3 failed")
+
+    # test4: flooding. the far side of the ring fills last
+    times, (xmin, ymin) = flood(oxygen_location, m)
+    if times.max() != 6 or times[3 - ymin, 1 - xmin] != 4:
+        raise Exception("test4 failed")
+    open_cells = np.array([[True, True, False],
+                           [False, True, True]])
+    if flood_grid(open_cells, [(0, 0), (1, 2)]).tolist() != [[0, 1, -1], [-1, 1, 0]]:
+        raise Exception("test4 failed: flood_grid")
+    partial = Grid()
+    for loc, cell in m.items():
+        if loc != (5, 2):
+            partial[loc] = cell
+    try:
+        flood(oxygen_location, partial)
+    except Exception as e:
+        if "partially explored" not in str(e):
+            raise
+    else:
+        raise Exception("test4 failed: partial map flooded")
+
+    # test5: map cache round trip, and rejecting other cache formats
+    tmpdir = tempfile.mkdtemp()
+    try:
+        save_map_cache(tmpdir, echo, m, oxygen_location)
+        loaded, loaded_oxygen, loaded_frontier = load_map_cache(tmpdir, echo)
+        if (loaded_oxygen != oxygen_location or loaded_frontier
+                or sorted((loc, cell[0], cell[2]) for loc, cell in loaded.items())
+                != sorted((loc, cell[0], cell[2]) for loc, cell in m.items())):
+            raise Exception("test5 failed")
+        if load_map_cache(tmpdir, [99]) is not None:
+            raise Exception("test5 failed: cache hit for another program")
+        path = os.path.join(tmpdir, program_hash(echo) + ".pickle")
+        with open(path, "wb") as outfile:
+            pickle.dump({"cells": {}, "oxygen": None}, outfile)
+        try:
+            load_map_cache(tmpdir, echo)
+        except Exception as e:
+            if "format" not in str(e):
+                raise
+        else:
+            raise Exception("test5 failed: old cache format accepted")
+    finally:
+        shutil.rmtree(tmpdir)
+
+    # test6: parallel exploration, stopped part way and then continued, of a
+    # maze (with a loop) held in a small droid program. The program reads a
+    # direction, looks up the cell it leads to in the map stored after the
+    # code, outputs it (0 wall, 1 open, 2 oxygen) and moves unless it is a wall
+    maze2 = ["#######",
+             "#X..#o#",
+             "#.#.#.#",
+             "#.....#",
+             "#######"]
+    width = len(maze2[0])
+    droid = [3, 33, 1001, 33, 36, 7, 1, 0, 34, 35, 1001, 35, 41, 15,
+             1001, 0, 0, 36, 4, 36, 1005, 36, 26, 1105, 1, 0,
+             1001, 35, 0, 34, 1105, 1, 0,
+             0, width + 1, 0, 0,        # direction, position, next position, cell
+             -width, width, 1, -1]      # position change for directions 1-4
+    droid += [{"#": 0, ".": 1, "X": 1, "o": 2}[c] for row in maze2 for c in row]
+    oxygen_location, steps, m, frontier = parallel_bfs(
+            (1, 1), processes=2, max_levels=3, raw_intcodes=droid)
+    if oxygen_location is not None or sorted(frontier) != [(2, 3), (3, 2)]:
+        raise Exception("test6 failed: partial exploration")
+    oxygen_location, steps, m, frontier = parallel_bfs(
+            (1, 1), processes=2, m=m, frontier=frontier)
+    if oxygen_location != (5, 1) or steps != 8 or frontier:
+        raise Exception("test6 failed: continued exploration")
+    # every open cell is explored, along with the walls next to them
+    expected = set()
+    for y, row in enumerate(maze2):
+        for x, content in enumerate(row):
+            if content != "#":
+                expected.add((x, y))
+                expected.update(next_location((x, y), d) for d in [1, 2, 3, 4])
+    if (set(m) != expected or any(m[(x, y)][0] != maze2[y][x] for x, y in expected)):
+        raise Exception("test6 failed: merged map")
+
+    # test7: shortest path queries, including walled and unreachable ends
+    m = Grid()
+    for y, row in enumerate(maze):
+        for x, content in enumerate(row):
+            m[(x, y)] = (content, None, None, 0)
+    router = MazeRouter(m, cache_size=2, promote_after=2)
+    # the first query from a source is answered without a distance field
+    if router.distance((1, 1), (3, 1)) != 2 or router.fields:
+        raise Exception("test7 failed: cold query")
+    if (router.route((1, 1), (3, 1)) != [(1, 1), (2, 1), (3, 1)]
+            or list(router.fields) != [(1, 1)]):
+        raise Exception("test7 failed: warm query")
+    # a field from either end answers the query
+    if (router.route((3, 3), (1, 1)) != [(3, 3), (2, 3), (1, 3), (1, 2), (1, 1)]
+            or list(router.fields) != [(1, 1)]):
+        raise Exception("test7 failed: reversed query")
+    for a, b in [((0, 0), (1, 1)), ((1, 1), (0, 0)), ((1, 1), (7, 1)), ((7, 2), (3, 3))]:
+        if router.distance(a, b) is not None or router.route(a, b) is not None:
+            raise Exception("test7 failed: {} to {} should be unreachable".format(a, b))
+    # only the most recently used fields are kept
+    for source in [(5, 3), (3, 1), (5, 3), (3, 1), (1, 1)]:
+        router.distance(source, (1, 3))
+    if list(router.fields) != [(3, 1), (1, 1)]:
+        raise Exception("test7 failed: cache eviction")
 
 
 if __name__ == "__main__":
-    oxygen_location, steps, m = bfs(goal="o")
-    # bfs(oxygen_location, goal=None)
-    flood(oxygen_location, m)
+    test()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--explore", choices=["snapshot", "backtrack", "parallel"],
+            default="snapshot",
+            help="map exploration mode: restore saved computer state per cell "
+                 "(snapshot), walk a single droid back along its path "
+                 "(backtrack), or probe the frontier across processes "
+                 "(parallel)")
+    parser.add_argument("--processes", type=int, default=None,
+            help="number of worker processes for parallel exploration")
+    parser.add_argument("--max-levels", type=int, default=None,
+            help="stop parallel exploration after this many levels")
+    parser.add_argument("--cache-dir", default=None,
+            help="directory for caching explored maps between runs; a "
+                 "partially explored map is always continued in parallel")
+    args = parser.parse_args()
+    raw_intcodes = read_input("input.txt")
+    cached = None
+    if args.cache_dir is not None:
+        cached = load_map_cache(args.cache_dir, raw_intcodes)
+    frontier = {}
+    explored = True
+    if cached is not None and not cached[2]:
+        # complete map in the cache; no exploration needed
+        m, oxygen_location, _ = cached
+        steps = report_oxygen(m, oxygen_location)
+        explored = False
+    elif cached is not None or args.explore == "parallel":
+        # explore in parallel, continuing from any partial map in the cache
+        if args.explore != "parallel":
+            print("continuing the partially explored map in the cache with "
+                  "parallel exploration instead of {}".format(args.explore))
+        m, _, frontier = cached or (None, None, None)
+        oxygen_location, steps, m, frontier = parallel_bfs(
+                processes=args.processes, m=m, frontier=frontier,
+                max_levels=args.max_levels)
+    elif args.explore == "backtrack":
+        oxygen_location, steps, m = dfs()
+    else:
+        oxygen_location, steps, m = bfs()
+    if args.cache_dir is not None and explored:
+        save_map_cache(args.cache_dir, raw_intcodes, m, oxygen_location,
+                       frontier)
+    if oxygen_location is None:
+        print("oxygen system not found; {} frontier cells left to explore"
+              .format(len(frontier)))
+    elif frontier:
+        print("map not fully explored; {} frontier cells left to explore"
+              .format(len(frontier)))
+    else:
+        flood(oxygen_location, m)